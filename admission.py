@@ -0,0 +1,88 @@
+import os
+import threading
+from contextlib import contextmanager
+
+from browser_pool import POOL_SIZE
+
+
+# --- ADMISSION CONFIGURATION ---
+# At most MAX_CONCURRENT_RENDERS renders use Chromium at once, and at most
+# MAX_QUEUE_DEPTH more may wait for a slot. Anything beyond that is rejected
+# with 429 and a Retry-After hint instead of being queued.
+MAX_CONCURRENT_RENDERS = int(os.environ.get("PDF_MAX_CONCURRENT_RENDERS", str(POOL_SIZE)))
+MAX_QUEUE_DEPTH = int(os.environ.get("PDF_MAX_QUEUE_DEPTH", "20"))
+RETRY_AFTER_SECONDS = int(os.environ.get("PDF_RETRY_AFTER_SECONDS", "10"))
+# Wall-clock budget for a single render, after which it is cancelled.
+RENDER_TIMEOUT_SECONDS = float(os.environ.get("PDF_RENDER_TIMEOUT_SECONDS", "120"))
+
+
+class QueueFullError(Exception):
+    """Raised when the server is already holding as much work as it accepts."""
+
+    def __init__(self, retry_after=RETRY_AFTER_SECONDS):
+        super().__init__(f"Server is busy, retry in {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Global backpressure for expensive work.
+
+    `admit()` reserves a place for a piece of work (running or waiting) and
+    raises QueueFullError when the queue is full; `release()` gives it back.
+    `render_slot()` is the global render semaphore that every Chromium render
+    must hold while it runs.
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_RENDERS, max_queue=MAX_QUEUE_DEPTH,
+                 retry_after=RETRY_AFTER_SECONDS):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._active = 0
+        self._rejected = 0
+
+    def admit(self):
+        with self._lock:
+            if self._admitted >= self.max_concurrent + self.max_queue:
+                self._rejected += 1
+                raise QueueFullError(self.retry_after)
+            self._admitted += 1
+
+    def release(self):
+        with self._lock:
+            self._admitted -= 1
+
+    @contextmanager
+    def admitted(self):
+        """Hold an admission for the duration of a synchronous request."""
+        self.admit()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @contextmanager
+    def render_slot(self):
+        """Block until one of the global render slots is free."""
+        with self._slots:
+            with self._lock:
+                self._active += 1
+            try:
+                yield
+            finally:
+                with self._lock:
+                    self._active -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active_renders": self._active,
+                "queued": max(0, self._admitted - self._active),
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "rejected": self._rejected,
+            }
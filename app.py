@@ -1,17 +1,88 @@
-from flask import Flask, render_template, request, send_file, url_for, jsonify
+from flask import Flask, render_template, request, send_file, url_for, jsonify, make_response, Response
 import asyncio
-from playwright.async_api import async_playwright
+import functools
 import os
 import subprocess
+import threading
 import uuid
-import requests
 from urllib.parse import urlparse
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 import re
 from urllib.parse import urljoin
-import base64
+import hashlib
+import json
+import math
+import shutil
+import sqlite3
+import time
+from html import escape
+from browser_pool import get_browser_pool
+from readiness import PageReadiness
+from request_filter import RequestFilter
+from image_prefetch import ImagePrefetcher, print_width
+from jobs import JobQueue
+from admission import AdmissionController, QueueFullError, RENDER_TIMEOUT_SECONDS
+from disk_cache import DiskCache
+from http_session import get_session
+from http_cache import HttpCache, PageTooLargeError, MAX_PAGE_MB
+from html_stream import parse_chunks
+from extraction_cache import ExtractionCache
+from boilerplate import BoilerplateClassifier
+from text_density import DensityIndex
+from phrase_matcher import PhraseMatcher, TextStream, load_phrases
+from pdf_stream import ChunkPipe, PdfTarget, print_pdf
+from raster_pdf import RasterPdfWriter, load_image
+import metrics
+from batch import (StagePipeline, stream_zip, BATCH_FETCH_WORKERS, BATCH_EXTRACT_WORKERS,
+                   BATCH_IMAGE_WORKERS, BATCH_RENDER_WORKERS, BATCH_MAX_URLS)
 
 app = Flask(__name__)
+render_jobs = JobQueue()
+admission = AdmissionController()
+
+# Rendered PDFs keyed by HTML content and render settings
+PDF_CACHE_DIR = os.environ.get("PDF_CACHE_DIR", os.path.join("cache", "pdf"))
+PDF_CACHE_MAX_MB = int(os.environ.get("PDF_CACHE_MAX_MB", "500"))
+pdf_cache = DiskCache(PDF_CACHE_DIR, PDF_CACHE_MAX_MB * 1024 * 1024, suffix=".pdf")
+# Raw article pages, revalidated with conditional requests once stale
+http_cache = HttpCache()
+# Cleaned article output keyed by URL, fetched body hash and extractor version.
+# Bump EXTRACTOR_VERSION whenever a change to the extraction code changes its output.
+EXTRACTOR_VERSION = 1
+extraction_cache = ExtractionCache(version=EXTRACTOR_VERSION)
+# Part of every PDF cache key. Bump RENDERER_VERSION whenever a change to the
+# render code changes its output, so PDFs from the old code stop being served.
+RENDERER_VERSION = 1
+# Article images, fetched during extraction and served to renders from disk
+image_prefetcher = ImagePrefetcher()
+
+# --- METRICS ---
+# Stage durations are recorded by metrics.span(); these are read at scrape time.
+@metrics.registry.gauge("pdf_render_queue_depth", "Admitted conversions waiting for a render slot.")
+def _queue_depth():
+    return admission.stats()["queued"]
+
+@metrics.registry.gauge("pdf_active_renders", "Renders currently holding a render slot.")
+def _active_renders():
+    return admission.stats()["active_renders"]
+
+@metrics.registry.gauge("pdf_rejected_total", "Conversions turned away with 429.", kind="counter")
+def _rejected():
+    return admission.stats()["rejected"]
+
+@metrics.registry.gauge("pdf_jobs", "Render jobs by status.", labelname="status")
+def _jobs():
+    stats = render_jobs.stats()
+    return {status: stats[status] for status in ("queued", "running", "done", "failed")}
+
+@metrics.registry.gauge("pdf_cache_hit_ratio", "Hit ratio of each cache layer.", labelname="cache")
+def _cache_hit_ratio():
+    return {
+        "pdf": pdf_cache.stats()["hit_ratio"],
+        "http": http_cache.stats()["hit_ratio"],
+        "extraction": extraction_cache.stats()["hit_ratio"],
+        "assets": image_prefetcher.cache.stats()["hit_ratio"]
+    }
 
 # --- PLAYWRIGHT SETUP ---
 def ensure_playwright_installed():
@@ -63,7 +134,7 @@ def download_webpage(url, output_path):
                     'Sec-Fetch-Mode': 'navigate',
                     'Sec-Fetch-Site': 'none'
                   }
-        response = requests.get(url, headers=headers, timeout=30)
+        response = get_session().get(url, headers=headers, timeout=30)
         response.raise_for_status()
         with open(output_path, 'w', encoding='utf-8') as f:
             f.write(response.text)
@@ -244,35 +315,70 @@ def create_clean_html_template(content, title="Document"):
 #################################################################################
 
 import os
-import base64
 import asyncio
-from playwright.async_api import async_playwright
 
-async def html_to_pdf_exact_replica(source, pdf_file, margin_inches=0.3):
+class InlineHtml(str):
+    """HTML markup handed to a render function in place of a file path or URL."""
+
+
+async def open_source(page, source):
+    """Load a render source into the page: InlineHtml markup, an http(s) URL or a local file path."""
+    with metrics.span("navigation"):
+        if isinstance(source, InlineHtml):
+            await page.set_content(source, wait_until='load', timeout=30000)
+        elif source.startswith('http://') or source.startswith('https://'):
+            await page.goto(source, wait_until='load', timeout=30000)
+        else:
+            await page.goto(f"file:///{os.path.abspath(source)}", wait_until='load', timeout=30000)
+
+
+async def source_image_assets(source):
+    """
+    Asset-cache lookup for a render source's images, serving each at the
+    print width the source's own markup gives it (see image_print_widths).
+    """
+    if not isinstance(source, InlineHtml) and (source.startswith('http://') or source.startswith('https://')):
+        return image_prefetcher.local_files({})
+
+    def widths():
+        if isinstance(source, InlineHtml):
+            html = source
+        else:
+            with open(source, encoding='utf-8', errors='replace') as f:
+                html = f.read()
+        return image_print_widths(BeautifulSoup(html, 'html.parser', parse_only=SoupStrainer('img')))
+    return image_prefetcher.local_files(await asyncio.to_thread(widths))
+
+
+async def html_to_pdf_exact_replica(source, pdf_file, margin_inches=0.3, report=None):
     """
     Intelligent approach with better width detection and content fitting.
+    If `report` is a dict, the readiness waits and request filter counts are recorded in it.
+    Images from other sites load as usual, since the point is an exact copy.
+    With `pdf_file` None the PDF bytes are returned; otherwise the PDF is
+    streamed to `pdf_file` (a path or a chunk callback) and its size returned.
     """
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        page = await browser.new_page()
+    async with get_browser_pool().context() as context:
+        page = await context.new_page()
+        readiness = await PageReadiness.attach(page)
+        request_filter = await RequestFilter.attach(page, await source_image_assets(source), first_party=False)
+        if report is not None:
+            report["readiness"] = readiness.history
+            report["requests"] = request_filter.counts
         
         try:
             # Navigate to the source
-            if source.startswith('http://') or source.startswith('https://'):
-                await page.goto(source, wait_until='networkidle', timeout=30000)
-            else:
-                await page.goto(f"file:///{os.path.abspath(source)}", wait_until='networkidle', timeout=30000)
+            await open_source(page, source)
 
             # Wait for page to fully load
-            await page.wait_for_timeout(3000)
-            await page.wait_for_function("document.fonts.ready")
+            await readiness.wait("load")
 
             # STEP 1: Set a reasonable viewport for content measurement
             await page.set_viewport_size({"width": 1200, "height": 800})
-            await page.wait_for_timeout(1000)
+            await readiness.wait("measure-viewport")
 
             # STEP 2: Get precise content measurements using bounding box approach
-            actual_dimensions = await page.evaluate("""() => {
+            actual_dimensions = await metrics.timed("measure", page.evaluate("""() => {
                 // Remove any fixed positioning or absolute elements that might skew measurements
                 const fixedElements = document.querySelectorAll('[style*="position: fixed"], [style*="position: absolute"]');
                 fixedElements.forEach(el => {
@@ -337,7 +443,7 @@ async def html_to_pdf_exact_replica(source, pdf_file, margin_inches=0.3):
                     width: Math.ceil(contentWidth),
                     height: Math.ceil(contentHeight)
                 };
-            }""")
+            }"""))
 
             print(f"MEASURED content: {actual_dimensions['width']}px x {actual_dimensions['height']}px")
 
@@ -410,7 +516,7 @@ async def html_to_pdf_exact_replica(source, pdf_file, margin_inches=0.3):
                 console.log('Applied precise positioning with wrapper approach');
             }}""")
 
-            await page.wait_for_timeout(2000)
+            await readiness.wait("wrap-content")
 
             # STEP 6: Apply print styles
             await page.add_style_tag(content=f'''
@@ -449,53 +555,117 @@ async def html_to_pdf_exact_replica(source, pdf_file, margin_inches=0.3):
                 }}
             ''')
 
-            await page.wait_for_timeout(1000)
+            await readiness.wait("print-styles")
 
             # STEP 7: Generate PDF
-            await page.pdf(
-                path=pdf_file,
-                width=f"{pdf_width_inches:.6f}in",
-                height=f"{pdf_height_inches:.6f}in",
-                print_background=True,
-                margin={"top": "0in", "right": "0in", "bottom": "0in", "left": "0in"},
-                prefer_css_page_size=True,
-                display_header_footer=False,
-                page_ranges="1",
-                scale=1.0,
-                format=None
-            )
+            with metrics.span("pdf_print"):
+                pdf_result = await print_pdf(
+                    page, pdf_file,
+                    width=f"{pdf_width_inches:.6f}in",
+                    height=f"{pdf_height_inches:.6f}in",
+                    print_background=True,
+                    margin={"top": "0in", "right": "0in", "bottom": "0in", "left": "0in"},
+                    prefer_css_page_size=True,
+                    display_header_footer=False,
+                    page_ranges="1",
+                    scale=1.0,
+                    format=None
+                )
             
-            if os.path.exists(pdf_file) and os.path.getsize(pdf_file) > 0:
+            if pdf_result:
                 print(f"✓ INTELLIGENT PDF generated successfully!")
                 print(f"✓ PDF dimensions: {pdf_width_inches:.3f}\" x {pdf_height_inches:.3f}\"")
-                return True
+                return pdf_result
             else:
                 raise Exception("PDF file was not created or is empty")
             
         except Exception as e:
             print(f"Error during conversion: {str(e)}")
             raise
-        finally:
-            await browser.close()
 
 
-async def html_to_pdf_screenshot_approach(source, pdf_file, margin_inches=0.3):
+# Height in CSS px of each strip the screenshot method captures.
+SCREENSHOT_TILE_HEIGHT = int(os.environ.get("SCREENSHOT_TILE_HEIGHT", "2048"))
+# Default strip encoding ("png", "jpeg", or "auto" to choose per strip), JPEG
+# quality and device scale factor for the screenshot method.
+SCREENSHOT_IMAGE_FORMATS = ("png", "jpeg", "auto")
+SCREENSHOT_IMAGE_FORMAT = os.environ.get("SCREENSHOT_IMAGE_FORMAT", "png")
+SCREENSHOT_JPEG_QUALITY = int(os.environ.get("SCREENSHOT_JPEG_QUALITY", "85"))
+SCREENSHOT_DEVICE_SCALE = float(os.environ.get("SCREENSHOT_DEVICE_SCALE", "1"))
+# In "auto" mode a strip at least this much covered by images is captured as JPEG.
+SCREENSHOT_AUTO_JPEG_COVERAGE = float(os.environ.get("SCREENSHOT_AUTO_JPEG_COVERAGE", "0.4"))
+
+# Document rectangles of the page's images, videos, canvases and background images
+IMAGE_AREAS_JS = """() => {
+    const areas = [];
+    for (const el of document.querySelectorAll('body *')) {
+        const tag = el.tagName;
+        const isImage = tag === 'IMG' || tag === 'VIDEO' || tag === 'CANVAS' ||
+                        getComputedStyle(el).backgroundImage.includes('url(');
+        if (!isImage) continue;
+        const rect = el.getBoundingClientRect();
+        if (rect.width >= 32 && rect.height >= 32) {
+            areas.push([rect.left + window.scrollX, rect.top + window.scrollY, rect.width, rect.height]);
+        }
+    }
+    return areas;
+}"""
+
+
+def raster_settings(image_format=None, quality=None, device_scale_factor=None):
+    """Validated screenshot encoding settings, with the configured defaults for anything not given."""
+    settings = {
+        "image_format": (image_format or SCREENSHOT_IMAGE_FORMAT).lower(),
+        "quality": int(quality or SCREENSHOT_JPEG_QUALITY),
+        "device_scale_factor": float(device_scale_factor or SCREENSHOT_DEVICE_SCALE)
+    }
+    if settings["image_format"] not in SCREENSHOT_IMAGE_FORMATS:
+        raise ValueError(f"image_format must be one of {', '.join(SCREENSHOT_IMAGE_FORMATS)}")
+    if not 1 <= settings["quality"] <= 100:
+        raise ValueError("quality must be between 1 and 100")
+    if not 0.5 <= settings["device_scale_factor"] <= 4:
+        raise ValueError("device_scale_factor must be between 0.5 and 4")
+    return settings
+
+
+def image_coverage(areas, top, width, height):
+    """Fraction of the strip (top, width, height) covered by image rectangles."""
+    covered = 0
+    for x, y, w, h in areas:
+        overlap_w = min(x + w, width) - max(x, 0)
+        overlap_h = min(y + h, top + height) - max(y, top)
+        if overlap_w > 0 and overlap_h > 0:
+            covered += overlap_w * overlap_h
+    return min(1.0, covered / (width * height))
+
+
+async def html_to_pdf_screenshot_approach(source, pdf_file, margin_inches=0.3, report=None, raster=None):
     """
     Fixed screenshot approach with proper error handling and imports.
+    Tall pages are captured in SCREENSHOT_TILE_HEIGHT strips, encoded as
+    `raster` (see raster_settings()) says; "auto" picks JPEG for strips
+    that are mostly images and PNG for text.
+    If `report` is a dict, the readiness waits, request filter counts and the
+    raster settings with the format used per strip are recorded in it.
+    With `pdf_file` None the PDF bytes are returned; otherwise the PDF is
+    streamed to `pdf_file` (a path or a chunk callback) and its size returned.
     """
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        page = await browser.new_page()
+    raster = raster or raster_settings()
+    tile_formats = {"png": 0, "jpeg": 0}
+    async with get_browser_pool().context(device_scale_factor=raster["device_scale_factor"]) as context:
+        page = await context.new_page()
+        readiness = await PageReadiness.attach(page)
+        request_filter = await RequestFilter.attach(page, await source_image_assets(source))
+        if report is not None:
+            report["readiness"] = readiness.history
+            report["requests"] = request_filter.counts
+            report["raster"] = dict(raster, tiles=tile_formats)
         
         try:
             # Navigate to source
-            if source.startswith('http://') or source.startswith('https://'):
-                await page.goto(source, wait_until='networkidle', timeout=30000)
-            else:
-                await page.goto(f"file:///{os.path.abspath(source)}", wait_until='networkidle', timeout=30000)
+            await open_source(page, source)
 
-            await page.wait_for_timeout(3000)
-            await page.wait_for_function("document.fonts.ready")
+            await readiness.wait("load")
 
             # Remove fixed/absolute positioned elements that might interfere
             await page.evaluate("""() => {
@@ -508,7 +678,7 @@ async def html_to_pdf_screenshot_approach(source, pdf_file, margin_inches=0.3):
             }""")
 
             # Get content dimensions from main container
-            dimensions = await page.evaluate("""() => {
+            dimensions = await metrics.timed("measure", page.evaluate("""() => {
                 const container = document.querySelector('.container') || 
                                 document.querySelector('main') || 
                                 document.querySelector('.content') ||
@@ -529,121 +699,238 @@ async def html_to_pdf_screenshot_approach(source, pdf_file, margin_inches=0.3):
                     width: Math.max(width, 400),  // Minimum width
                     height: Math.max(height, 300) // Minimum height
                 };
-            }""")
+            }"""))
             
             print(f"Screenshot dimensions: {dimensions['width']}px x {dimensions['height']}px")
             
-            # Set viewport to content size
+            content_height = math.ceil(dimensions['height'])
+            
+            # Capture a viewport-sized strip at a time rather than one full-height surface
             await page.set_viewport_size({
                 "width": dimensions['width'],
-                "height": dimensions['height']
+                "height": min(SCREENSHOT_TILE_HEIGHT, content_height)
             })
             
-            await page.wait_for_timeout(1000)
+            await readiness.wait("screenshot-viewport")
             
-            # Take high-quality screenshot
-            screenshot_buffer = await page.screenshot(
-                type='png',
-                full_page=True,
-                clip={
-                    'x': 0,
-                    'y': 0,
-                    'width': dimensions['width'],
-                    'height': dimensions['height']
-                }
-            )
+            image_areas = await page.evaluate(IMAGE_AREAS_JS) if raster["image_format"] == "auto" else []
             
             # Calculate PDF dimensions
             content_width_inches = dimensions['width'] / 96
-            content_height_inches = dimensions['height'] / 96
+            content_height_inches = content_height / 96
             pdf_width_inches = content_width_inches + (2 * margin_inches)
             pdf_height_inches = content_height_inches + (2 * margin_inches)
             
             print(f"PDF size: {pdf_width_inches:.3f}\" x {pdf_height_inches:.3f}\"")
             
-            # Create HTML with embedded image
-            try:
-                image_data = base64.b64encode(screenshot_buffer).decode('utf-8')
-            except Exception as e:
-                raise Exception(f"Failed to encode screenshot: {str(e)}")
+            # Embed each strip in the PDF as-is as soon as it is captured, and pass
+            # the PDF on as it grows; only one strip is held at a time
+            with PdfTarget(pdf_file) as output:
+                writer = RasterPdfWriter()
+                writer.begin_page(pdf_width_inches * 72, pdf_height_inches * 72)
+                for top in range(0, content_height, SCREENSHOT_TILE_HEIGHT):
+                    tile_height = min(SCREENSHOT_TILE_HEIGHT, content_height - top)
+                    tile_format = raster["image_format"]
+                    if tile_format == "auto":
+                        coverage = image_coverage(image_areas, top, dimensions['width'], tile_height)
+                        tile_format = "jpeg" if coverage >= SCREENSHOT_AUTO_JPEG_COVERAGE else "png"
+                    tile_formats[tile_format] += 1
+                    with metrics.span("screenshot"):
+                        tile = await page.screenshot(
+                            type=tile_format,
+                            quality=raster["quality"] if tile_format == "jpeg" else None,
+                            full_page=True,
+                            clip={
+                                'x': 0,
+                                'y': top,
+                                'width': dimensions['width'],
+                                'height': tile_height
+                            }
+                        )
+                    with metrics.span("pdf_assemble"):
+                        writer.draw_image(load_image(tile, opaque=True), margin_inches * 72,
+                                          (margin_inches + top / 96) * 72, content_width_inches * 72,
+                                          tile_height / 96 * 72)
+                    for chunk in writer.drain():
+                        await output.write(chunk)
+                writer.close()
+                for chunk in writer.drain():
+                    await output.write(chunk)
+            pdf_result = output.result()
             
-            html_content = f'''<!DOCTYPE html>
-<html>
-<head>
-    <style>
-        @page {{
-            size: {pdf_width_inches:.6f}in {pdf_height_inches:.6f}in;
-            margin: 0;
-        }}
-        body {{
-            margin: {margin_inches}in;
-            padding: 0;
-            width: calc(100% - {margin_inches * 2}in);
-            height: calc(100% - {margin_inches * 2}in);
-            display: flex;
-            justify-content: center;
-            align-items: flex-start;
-        }}
-        img {{
-            width: {content_width_inches:.6f}in;
-            height: {content_height_inches:.6f}in;
-            object-fit: contain;
-            display: block;
-        }}
-    </style>
-</head>
-<body>
-    <img src="data:image/png;base64,{image_data}" alt="Page content" />
-</body>
-</html>'''
-            
-            # Create temporary HTML file
-            temp_html = pdf_file.replace('.pdf', '_temp.html')
-            try:
-                with open(temp_html, 'w', encoding='utf-8') as f:
-                    f.write(html_content)
-            except Exception as e:
-                raise Exception(f"Failed to write temporary HTML: {str(e)}")
-            
-            # Generate PDF from the image-based HTML
-            await page.goto(f"file:///{os.path.abspath(temp_html)}", wait_until='networkidle')
-            await page.wait_for_timeout(1000)
-            
-            await page.pdf(
-                path=pdf_file,
-                width=f"{pdf_width_inches:.6f}in",
-                height=f"{pdf_height_inches:.6f}in",
-                print_background=True,
-                margin={"top": "0in", "right": "0in", "bottom": "0in", "left": "0in"},
-                prefer_css_page_size=True,
-                display_header_footer=False,
-                scale=1.0
-            )
-            
-            # Clean up temp file
-            if os.path.exists(temp_html):
-                try:
-                    os.remove(temp_html)
-                except:
-                    pass  # Don't fail if cleanup fails
-            
-            if os.path.exists(pdf_file) and os.path.getsize(pdf_file) > 0:
+            if pdf_result:
                 print(f"✓ SCREENSHOT PDF generated successfully!")
-                return True
+                return pdf_result
             else:
                 raise Exception("PDF file was not created or is empty")
             
         except Exception as e:
             print(f"Error during screenshot conversion: {str(e)}")
             raise
-        finally:
-            await browser.close()
+
+
+def render_with_budget(coro):
+    """
+    Run a render coroutine on the browser pool while holding a global render
+    slot, cancelling it if it runs past its time budget.
+    """
+    with admission.render_slot():
+        try:
+            return get_browser_pool().run(coro, timeout=RENDER_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            raise Exception(f"Render exceeded its {RENDER_TIMEOUT_SECONDS:.0f}s time budget")
+
+
+def run_admitted(fn, *args):
+    """Run admitted work on a job worker and give its admission back afterwards."""
+    try:
+        return fn(*args)
+    finally:
+        admission.release()
+
+
+def with_server_timing(view):
+    """Collect the stage spans of a request and report them in a Server-Timing header."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with metrics.collect_timings() as timings:
+            response = make_response(view(*args, **kwargs))
+        totals = metrics.summarize_timings(timings)
+        if totals:
+            response.headers["Server-Timing"] = metrics.server_timing_header(totals)
+        return response
+    return wrapper
+
+
+def with_job_timings(fn):
+    """Collect the stage spans of a job and add them to its result as `timings` (ms per stage)."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with metrics.collect_timings() as timings:
+            result = fn(*args, **kwargs)
+        result["timings"] = metrics.summarize_timings(timings)
+        return result
+    return wrapper
+
+
+def busy_response(error):
+    """JSON 429 response telling the client when to retry."""
+    response = jsonify({"error": str(error), "retry_after": error.retry_after})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
+
+def pdf_cache_key(html_path, use_screenshot, margin_inches, raster=None):
+    """Content address of a render: the HTML bytes plus every render setting."""
+    digest = hashlib.sha256()
+    with open(html_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    method = 'screenshot' if use_screenshot else 'intelligent'
+    return render_cache_key(digest.hexdigest(), method, margin_inches, raster, source_kind="file")
+
+
+def render_cache_key(html_digest, method, margin_inches, raster=None, source_kind="file"):
+    """
+    PDF cache key for HTML with the given SHA-256 digest rendered by `method`,
+    plus the raster settings of a screenshot render and the RENDERER_VERSION.
+    `source_kind` is how the HTML reaches Chromium ("file" or "inline"), since
+    the same bytes resolve relative URLs differently when loaded from uploads/
+    and from memory.
+    """
+    settings = f"|{json.dumps(raster, sort_keys=True)}" if raster else ""
+    return hashlib.sha256(
+        f"v{RENDERER_VERSION}|{html_digest}|{method}|{margin_inches}|{source_kind}{settings}".encode()).hexdigest()
+
+
+def with_base_href(html, base_url):
+    """
+    Give inline HTML a <base href> so its relative image, CSS and font URLs
+    resolve against `base_url` instead of about:blank. A document that
+    already declares a base is left alone.
+    """
+    if re.search(r'<base\b', html, re.I):
+        return html
+    tag = f'<base href="{escape(base_url, quote=True)}">'
+    head = re.search(r'<head\b[^>]*>', html, re.I)
+    if head:
+        return html[:head.end()] + tag + html[head.end():]
+    return tag + html
+
+
+@with_job_timings
+def run_conversion(html_path, pdf_path, pdf_filename, use_screenshot, cache_key=None, raster=None):
+    """
+    Render one uploaded HTML file to PDF. Runs on a render job worker.
+    `raster` holds the screenshot method's encoding settings.
+    Falls back to the intelligent approach if the screenshot method fails.
+    The finished PDF is stored in the PDF cache under `cache_key`, unless it
+    came from the fallback: `cache_key` names the screenshot render.
+    """
+    print(f"Method: {'Screenshot' if use_screenshot else 'Intelligent'}")
+
+    report = {}
+    try:
+        if use_screenshot:
+            print("Using screenshot-based approach...")
+            render_with_budget(html_to_pdf_screenshot_approach(html_path, pdf_path, margin_inches=0.3, report=report,
+                                                               raster=raster))
+            message = "Perfect visual replica using screenshot approach with exact margins"
+        else:
+            print("Using intelligent measurement approach...")
+            render_with_budget(html_to_pdf_exact_replica(html_path, pdf_path, margin_inches=0.3, report=report))
+            message = "Intelligent measurement with preserved styling and optimized width"
+
+        if not os.path.exists(pdf_path) or os.path.getsize(pdf_path) == 0:
+            raise Exception("PDF file was not created or is empty")
+
+    except Exception as conversion_error:
+        print(f"Conversion error: {str(conversion_error)}")
+        # If screenshot fails, try intelligent as fallback
+        if not use_screenshot:
+            raise Exception(f"PDF conversion failed: {str(conversion_error)}")
+        print("Screenshot failed, trying intelligent approach as fallback...")
+        try:
+            report = {}
+            render_with_budget(html_to_pdf_exact_replica(html_path, pdf_path, margin_inches=0.3, report=report))
+            message = "Screenshot failed - used intelligent approach as fallback"
+            cache_key = None
+        except Exception:
+            raise Exception(f"PDF conversion failed: {str(conversion_error)}")
+
+    if cache_key:
+        try:
+            with metrics.span("file_write"):
+                pdf_cache.put_file(cache_key, pdf_path)
+        except OSError as e:
+            print(f"Could not cache PDF: {str(e)}")
+
+    print(f"✓ Conversion completed: {pdf_filename}")
+    result = {
+        "success": True,
+        "pdf_filename": pdf_filename,
+        "message": message,
+        "cache": "miss",
+        "readiness": report.get("readiness", []),
+        "requests": report.get("requests")
+    }
+    if "raster" in report:
+        result["raster"] = report["raster"]
+    return result
 
 
 @app.route("/convert", methods=["POST"])
+@with_server_timing
 def convert_to_pdf():
     """
-    Updated Flask route with better error handling and method selection.
+    Serve the PDF from the cache when this HTML was already rendered with the
+    same settings; otherwise queue a conversion and return its job ID straight
+    away. Poll /jobs/<job_id> for the result.
+
+    The screenshot method takes optional image_format (png, jpeg or auto),
+    quality and device_scale_factor fields; the settings used are echoed
+    back as `raster`.
     """
     try:
         filename = request.form.get("filename")
@@ -655,6 +942,14 @@ def convert_to_pdf():
         if not filename or not base_name:
             return jsonify({"error": "Missing filename or base_name parameter."}), 400
         
+        raster = None
+        if use_screenshot:
+            try:
+                raster = raster_settings(request.form.get("image_format"), request.form.get("quality"),
+                                         request.form.get("device_scale_factor"))
+            except ValueError as e:
+                return jsonify({"error": f"Invalid raster setting: {str(e)}"}), 400
+        
         html_path = os.path.join("uploads", filename)
         pdf_filename = f"{base_name}.pdf"
         pdf_path = os.path.join("uploads", pdf_filename)
@@ -662,51 +957,241 @@ def convert_to_pdf():
         if not os.path.exists(html_path):
             return jsonify({"error": f"Source HTML file not found: {filename}"}), 404
         
-        print(f"Starting conversion: {filename} -> {pdf_filename}")
-        print(f"Method: {'Screenshot' if use_screenshot else 'Intelligent'}")
-        
-        try:
-            if use_screenshot:
-                print("Using screenshot-based approach...")
-                asyncio.run(html_to_pdf_screenshot_approach(html_path, pdf_path, margin_inches=0.3))
-                message = "Perfect visual replica using screenshot approach with exact margins"
-            else:
-                print("Using intelligent measurement approach...")
-                asyncio.run(html_to_pdf_exact_replica(html_path, pdf_path, margin_inches=0.3))
-                message = "Intelligent measurement with preserved styling and optimized width"
-
-            if not os.path.exists(pdf_path) or os.path.getsize(pdf_path) == 0:
-                raise Exception("PDF file was not created or is empty")
-                
-            print(f"✓ Conversion completed: {pdf_filename}")
+        with metrics.span("cache_lookup"):
+            cache_key = pdf_cache_key(html_path, use_screenshot, margin_inches=0.3, raster=raster)
+            cached_pdf = pdf_cache.get(cache_key)
+        if cached_pdf:
+            with metrics.span("file_write"):
+                shutil.copyfile(cached_pdf, pdf_path)
+            print(f"✓ Served {pdf_filename} from PDF cache")
             return jsonify({
-                "success": True, 
+                "success": True,
+                "status": "done",
                 "pdf_filename": pdf_filename,
-                "message": message
+                "message": "Served from cache",
+                "cache": "hit",
+                "raster": raster
             })
-            
-        except Exception as conversion_error:
-            print(f"Conversion error: {str(conversion_error)}")
-            # If screenshot fails, try intelligent as fallback
-            if use_screenshot:
-                print("Screenshot failed, trying intelligent approach as fallback...")
-                try:
-                    asyncio.run(html_to_pdf_exact_replica(html_path, pdf_path, margin_inches=0.3))
-                    return jsonify({
-                        "success": True, 
-                        "pdf_filename": pdf_filename,
-                        "message": "Screenshot failed - used intelligent approach as fallback"
-                    })
-                except:
-                    pass
-            
-            raise conversion_error
+        
+        try:
+            admission.admit()
+        except QueueFullError as e:
+            print(f"✗ Rejected conversion of {filename}: {str(e)}")
+            return busy_response(e)
+        try:
+            job_id = render_jobs.submit(run_admitted, run_conversion, html_path, pdf_path, pdf_filename,
+                                        use_screenshot, cache_key, raster)
+        except Exception:
+            admission.release()
+            raise
+        print(f"Queued conversion job {job_id}: {filename} -> {pdf_filename}")
+        return jsonify({
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": url_for("job_status", job_id=job_id),
+            "cache": "miss",
+            "raster": raster
+        }), 202
     
     except Exception as e:
         error_msg = f"PDF conversion failed: {str(e)}"
         print(f"✗ {error_msg}")
         return jsonify({"error": error_msg}), 500
 
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    """Report the status of a queued conversion, including its result once done."""
+    job = render_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown or expired job: {job_id}"}), 404
+
+    response = {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"]
+    }
+    if job["status"] == "done":
+        response.update(job["result"])
+    elif job["status"] == "failed":
+        response["success"] = False
+        response["error"] = job["error"]
+    response = jsonify(response)
+    if job["status"] == "done" and job["result"].get("timings"):
+        # Where the job's seconds went, for the browser's network panel
+        response.headers["Server-Timing"] = metrics.server_timing_header(job["result"]["timings"])
+    return response
+
+# Render functions for the one-request API, by `method`
+API_RENDER_METHODS = {
+    "intelligent": lambda source, pdf_file=None: html_to_pdf_exact_replica(source, pdf_file, margin_inches=0.3),
+    "screenshot": lambda source, pdf_file=None: html_to_pdf_screenshot_approach(source, pdf_file, margin_inches=0.3),
+    "beautiful": lambda source, pdf_file=None: html_to_pdf_beautiful_url(source, pdf_file)
+}
+
+
+def start_streamed_render(method, html, cache_key):
+    """
+    Render `html` on a background thread, streaming the PDF out of Chromium
+    into the returned ChunkPipe and into the PDF cache as it is printed.
+    Releases the caller's admission when the render ends. A failed
+    screenshot render falls back to the intelligent method as long as no
+    bytes have been sent yet. The fallback PDF is streamed but not cached,
+    since `cache_key` names the screenshot render.
+    """
+    pipe = ChunkPipe()
+
+    def render(render_method):
+        with pdf_cache.writer(cache_key) as cache_file:
+            async def write(chunk):
+                cache_file.write(chunk)
+                await pipe.write(chunk)
+            render_with_budget(API_RENDER_METHODS[render_method](InlineHtml(html), write))
+
+    def render_uncached(render_method):
+        render_with_budget(API_RENDER_METHODS[render_method](InlineHtml(html), pipe.write))
+
+    def produce():
+        try:
+            try:
+                render(method)
+            except Exception:
+                if method != "screenshot" or pipe.bytes_written:
+                    raise
+                print("Screenshot failed, trying intelligent approach as fallback...")
+                render_uncached("intelligent")
+            pipe.close()
+        except Exception as e:
+            print(f"✗ Streamed API conversion failed: {str(e)}")
+            pipe.close(e)
+        finally:
+            admission.release()
+
+    threading.Thread(target=produce, name="pdf-stream", daemon=True).start()
+    return pipe
+
+
+@app.route("/api/convert", methods=["POST"])
+@with_server_timing
+def api_convert():
+    """
+    Convert in a single request, for service-to-service callers: send raw HTML
+    as the body (or JSON {"html": ...} / {"url": ...}, optionally with
+    "method" and "filename") and get the PDF bytes back. The page is rendered
+    in memory; nothing is written to uploads/. Send "base_url" with HTML
+    whose relative URLs (images, CSS, fonts) should resolve against it.
+
+    HTML defaults to the intelligent method; URLs are extracted to a clean
+    article and rendered with the beautiful layout unless another method is
+    given.
+
+    With ?stream=1 (or "stream": true) the PDF is sent in chunks as Chromium
+    prints it, so large documents start arriving sooner and are never held
+    whole in memory. Errors after the first chunk cut the response short.
+    """
+    max_bytes = MAX_PAGE_MB * 1024 * 1024
+    if request.content_length and request.content_length > max_bytes:
+        return jsonify({"error": f"Request body is larger than {MAX_PAGE_MB} MB."}), 413
+
+    if request.is_json:
+        payload = request.get_json(silent=True) or {}
+        if not isinstance(payload, dict):
+            return jsonify({"error": "Send a JSON object."}), 400
+    else:
+        payload = dict(request.args)
+        body = request.get_data()
+        if body:
+            payload["html"] = body.decode(request.mimetype_params.get("charset", "utf-8"), errors="replace")
+    for field in ("html", "url", "base_url", "method", "filename"):
+        if payload.get(field) is not None and not isinstance(payload[field], str):
+            return jsonify({"error": f"{field} must be a string."}), 400
+    html, url = payload.get("html"), payload.get("url")
+    if bool(html) == bool(url):
+        return jsonify({"error": "Send either HTML in the body or a URL."}), 400
+    if url and not is_valid_url(url):
+        return jsonify({"error": f"Invalid URL: {url}"}), 400
+    base_url = payload.get("base_url")
+    if base_url and not is_valid_url(base_url):
+        return jsonify({"error": f"Invalid base URL: {base_url}"}), 400
+    if html and base_url:
+        html = with_base_href(html, base_url)
+
+    method = payload.get("method") or ("beautiful" if url else "intelligent")
+    if method not in API_RENDER_METHODS:
+        return jsonify({"error": f"Unknown method {method!r}; use one of {sorted(API_RENDER_METHODS)}."}), 400
+    filename = re.sub(r'[^\w.-]', '_', payload.get("filename") or "document.pdf")
+    stream = str(payload.get("stream", "")).lower() in ("1", "true")
+
+    try:
+        admission.admit()
+    except QueueFullError as e:
+        return busy_response(e)
+    # A streamed render keeps the admission until its last chunk is printed
+    handed_off = False
+    try:
+        if url:
+            try:
+                html = beautiful_html_from_page(fetch_url_page(url), url)
+            except PageTooLargeError as e:
+                return jsonify({"error": str(e)}), 413
+            if not html:
+                return jsonify({"error": "Could not extract article content from the URL."}), 422
+
+        with metrics.span("cache_lookup"):
+            raster = raster_settings() if method == "screenshot" else None
+            cache_key = render_cache_key(hashlib.sha256(html.encode("utf-8")).hexdigest(), method, 0.3, raster,
+                                         source_kind="inline")
+            cached_pdf = pdf_cache.get(cache_key)
+        if cached_pdf:
+            with open(cached_pdf, 'rb') as f:
+                pdf_bytes = f.read()
+            cache_status = "hit"
+        elif stream:
+            chunks = iter(start_streamed_render(method, html, cache_key))
+            handed_off = True
+            # Wait for the first chunk, so a render that fails up front still gets a 500
+            first_chunk = next(chunks, b"")
+
+            def stream_chunks():
+                try:
+                    yield first_chunk
+                    yield from chunks
+                finally:
+                    chunks.close()
+            pdf_bytes = stream_chunks()
+            cache_status = "miss"
+        else:
+            try:
+                pdf_bytes = render_with_budget(API_RENDER_METHODS[method](InlineHtml(html)))
+            except Exception:
+                if method != "screenshot":
+                    raise
+                print("Screenshot failed, trying intelligent approach as fallback...")
+                pdf_bytes = render_with_budget(API_RENDER_METHODS["intelligent"](InlineHtml(html)))
+                # Not a screenshot render, so it must not answer for one later
+                cache_key = None
+            if cache_key:
+                try:
+                    with metrics.span("file_write"):
+                        pdf_cache.put_bytes(cache_key, pdf_bytes)
+                except OSError as e:
+                    print(f"Could not cache PDF: {str(e)}")
+            cache_status = "miss"
+    except Exception as e:
+        print(f"✗ API conversion failed: {str(e)}")
+        return jsonify({"error": f"PDF conversion failed: {str(e)}"}), 500
+    finally:
+        if not handed_off:
+            admission.release()
+
+    response = Response(pdf_bytes, mimetype="application/pdf")
+    response.headers["Content-Disposition"] = f'inline; filename="{filename}"'
+    response.headers["X-Cache"] = cache_status
+    return response
+
+
 ###################################################################################
 
 
@@ -759,27 +1244,31 @@ def extract_title_from_url_content(soup):
     
     return "Article"
 
-def calculate_readability_score(element):
-    """Calculate readability score using text-to-link ratio and other heuristics"""
+def calculate_readability_score(element, density=None):
+    """Calculate readability score using text-to-link ratio and other heuristics.
+    Pass a DensityIndex built over the element's tree to score without re-walking it."""
     if not element:
         return 0
     
-    text_content = element.get_text(strip=True)
-    if len(text_content) < 100:  # Too short to be main content
-        return 0
-    
-    # Count links vs text
-    links = element.find_all('a')
-    link_chars = sum(len(link.get_text(strip=True)) for link in links)
-    text_chars = len(text_content)
+    stats = density.get(element) if density is not None else None
+    if stats is not None:
+        text_chars = stats.text_len
+        link_chars = stats.link_text_len
+        comma_count = stats.comma_count
+        paragraph_count = stats.p_count
+    else:
+        text_content = element.get_text(strip=True)
+        links = element.find_all('a')
+        link_chars = sum(len(link.get_text(strip=True)) for link in links)
+        text_chars = len(text_content)
+        comma_count = text_content.count(',')
+        paragraph_count = len(element.find_all('p'))
     
-    if text_chars == 0:
+    if text_chars < 100:  # Too short to be main content
         return 0
     
     # Readability heuristics
     link_ratio = link_chars / text_chars if text_chars > 0 else 1
-    comma_count = text_content.count(',')
-    paragraph_count = len(element.find_all('p'))
     
     # Higher score for more text, fewer links, more paragraphs
     score = text_chars * (1 - min(link_ratio, 0.8))  # Penalize high link ratio
@@ -792,43 +1281,51 @@ def calculate_readability_score(element):
     
     return score
 
+# Remove all non-content elements
+URL_BOILERPLATE_TAGS = [
+    'script', 'style', 'noscript', 'link', 'meta', 'nav', 'header', 'footer', 
+    'aside', 'form', 'input', 'button', 'select', 'textarea', 'iframe', 'embed'
+]
+
+# More aggressive removal patterns for extra content
+URL_BOILERPLATE_PATTERNS = [
+    r'\bnav\b', r'\bmenu\b', r'\bheader\b', r'\bfooter\b', r'\bsidebar\b',
+    r'\bsocial\b', r'\bshare\b', r'\bcomment\b', r'\bad\b', r'\bpromo\b',
+    r'\bpopup\b', r'\bmodal\b', r'\bbreadcrumb\b', r'\brelated\b',
+    r'\bnewsletter\b', r'\bsubscribe\b', r'\bauthor\b', r'\bmeta\b',
+    r'\btrial\b', r'\bsignup\b', r'\bregister\b', r'\bcta\b', r'\bbanner\b',
+    r'\bwidget\b', r'\bexpertise\b', r'\binterested\b', r'\barticles\b',
+    r'\bview-all\b', r'\bmore-articles\b', r'\bsuggested\b', r'\brecommend\b'
+]
+
+url_boilerplate = BoilerplateClassifier(URL_BOILERPLATE_TAGS, URL_BOILERPLATE_PATTERNS)
+
+# Promotional/non-article content indicators, matched against section text, class and id.
+# Set UNWANTED_PHRASES_FILE to a file with one phrase per line to replace this list.
+DEFAULT_UNWANTED_PHRASES = [
+    'start free', 'free trial', 'create account', 'sign up', 'register',
+    'expertise', 'view all articles', 'you might also be interested',
+    'technical writer', 'years experience', 'follow', 'subscribe',
+    'related articles', 'more articles', 'suggested reading',
+    'bright data', 'proxy services', 'web scraper apis',
+    'min read', 'also be interested', 'discover how to build'
+]
+UNWANTED_PHRASES = load_phrases(os.environ.get("UNWANTED_PHRASES_FILE"), DEFAULT_UNWANTED_PHRASES)
+unwanted_phrases = PhraseMatcher(UNWANTED_PHRASES)
+# Words that mark a short section as a call to action
+promo_words = PhraseMatcher(['start', 'trial', 'account', 'free'])
+
 def extract_article_content_from_url(soup, original_url):
     """Extract main article content using advanced readability algorithm"""
     
     if not soup:
         return None
     
-    # Remove all non-content elements
-    elements_to_remove = [
-        'script', 'style', 'noscript', 'link', 'meta', 'nav', 'header', 'footer', 
-        'aside', 'form', 'input', 'button', 'select', 'textarea', 'iframe', 'embed'
-    ]
-    
-    for tag_name in elements_to_remove:
-        for tag in soup.find_all(tag_name):
-            tag.decompose()
-    
-    # More aggressive removal patterns for extra content
-    removal_patterns = [
-        r'\bnav\b', r'\bmenu\b', r'\bheader\b', r'\bfooter\b', r'\bsidebar\b',
-        r'\bsocial\b', r'\bshare\b', r'\bcomment\b', r'\bad\b', r'\bpromo\b',
-        r'\bpopup\b', r'\bmodal\b', r'\bbreadcrumb\b', r'\brelated\b',
-        r'\bnewsletter\b', r'\bsubscribe\b', r'\bauthor\b', r'\bmeta\b',
-        r'\btrial\b', r'\bsignup\b', r'\bregister\b', r'\bcta\b', r'\bbanner\b',
-        r'\bwidget\b', r'\bexpertise\b', r'\binterested\b', r'\barticles\b',
-        r'\bview-all\b', r'\bmore-articles\b', r'\bsuggested\b', r'\brecommend\b'
-    ]
+    # Strip navigation, ads, promos and other boilerplate in a single tree walk
+    url_boilerplate.strip(soup)
     
-    for pattern in removal_patterns:
-        try:
-            for element in soup.find_all(class_=re.compile(pattern, re.I)):
-                if element:
-                    element.decompose()
-            for element in soup.find_all(id=re.compile(pattern, re.I)):
-                if element:
-                    element.decompose()
-        except Exception:
-            continue
+    # Text, paragraph and link counts for every element, gathered in one pass
+    density = DensityIndex(soup)
     
     # Find main article content
     content_selectors = [
@@ -845,11 +1342,10 @@ def extract_article_content_from_url(soup, original_url):
                 if not element:
                     continue
                     
-                paragraphs = element.find_all('p')
-                text_content = element.get_text(strip=True)
+                stats = density[element]
                 
-                if len(paragraphs) >= 2 and len(text_content) >= 300:
-                    score = len(text_content) + len(paragraphs) * 50
+                if stats.p_count >= 2 and stats.text_len >= 300:
+                    score = stats.text_len + stats.p_count * 50
                     if element.name == 'article':
                         score += 1000
                     candidates.append((element, score))
@@ -866,11 +1362,9 @@ def extract_article_content_from_url(soup, original_url):
         for container in containers:
             if not container:
                 continue
-            paragraphs = container.find_all('p')
-            if len(paragraphs) >= 3:
-                total_text = sum(len(p.get_text(strip=True)) for p in paragraphs if p)
-                if total_text >= 500:
-                    paragraph_scores.append((container, total_text))
+            stats = density[container]
+            if stats.p_count >= 3 and stats.p_text_len >= 500:
+                paragraph_scores.append((container, stats.p_text_len))
         
         if paragraph_scores:
             main_content = max(paragraph_scores, key=lambda x: x[1])[0]
@@ -883,13 +1377,12 @@ def extract_article_content_from_url(soup, original_url):
             for container in all_containers:
                 if not container:
                     continue
-                text_content = container.get_text(strip=True)
-                if len(text_content) >= 200:  # Lower threshold
+                stats = density[container]
+                if stats.text_len >= 200:  # Lower threshold
                     # Count paragraphs, headings, and other content elements
-                    content_elements = container.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li'])
-                    score = len(text_content) + len(content_elements) * 25
+                    score = stats.text_len + stats.content_count * 25
                     fallback_scores.append((container, score))
-                    print(f"Found potential content container with {len(text_content)} chars and {len(content_elements)} elements")
+                    print(f"Found potential content container with {stats.text_len} chars and {stats.content_count} elements")
             
             if fallback_scores:
                 main_content = max(fallback_scores, key=lambda x: x[1])[0]
@@ -903,30 +1396,24 @@ def extract_article_content_from_url(soup, original_url):
         # Remove author bio sections, related articles, and promotional content
         unwanted_sections = []
         
+        # Lowercased text of every section as spans of one stream, scanned once per phrase set
+        stream = TextStream(main_content)
+        promo_starts = unwanted_phrases.latest_starts(stream.text)
+        cta_starts = promo_words.latest_starts(stream.text)
+        
         # Find elements that look like promotional/non-article content
         for element in main_content.find_all(['div', 'section']):
-            element_text = element.get_text(strip=True).lower()
+            start, end = stream.span(element)
             element_classes = ' '.join(element.get('class', [])).lower()
             element_id = element.get('id', '').lower()
             
             # Check for promotional/non-article content indicators
-            unwanted_indicators = [
-                'start free', 'free trial', 'create account', 'sign up', 'register',
-                'expertise', 'view all articles', 'you might also be interested',
-                'technical writer', 'years experience', 'follow', 'subscribe',
-                'related articles', 'more articles', 'suggested reading',
-                'bright data', 'proxy services', 'web scraper apis',
-                'min read', 'also be interested', 'discover how to build'
-            ]
-            
-            should_remove = False
-            for indicator in unwanted_indicators:
-                if indicator in element_text or indicator in element_classes or indicator in element_id:
-                    should_remove = True
-                    break
+            should_remove = (promo_starts[end] >= start
+                             or unwanted_phrases.search(element_classes)
+                             or unwanted_phrases.search(element_id))
             
             # Also remove if it's a short section at the end with promotional links
-            if len(element_text) < 200 and any(word in element_text for word in ['start', 'trial', 'account', 'free']):
+            if end - start < 200 and cta_starts[end] >= start:
                 should_remove = True
             
             if should_remove:
@@ -1431,87 +1918,190 @@ def create_beautiful_url_html(title, content_html):
 </body>
 </html>"""
 
+def extract_article_from_html(html_text, url):
+    """Parse a fetched page and return (title, content_html), or None if no article was found"""
+    print("Parsing HTML content...")
+    return extract_article_from_soup(BeautifulSoup(html_text, 'lxml'), url)
+
+def extract_article_from_soup(soup, url):
+    """Return (title, content_html) from a parsed page, or None if no article was found"""
+    if not soup:
+        print("Error: Failed to parse HTML")
+        return None
+    
+    # Extract title and content
+    print("Extracting title...")
+    title = extract_title_from_url_content(soup)
+    print(f"Extracted title: {title}")
+    
+    print("Extracting article content...")
+    main_content = extract_article_content_from_url(soup, url)
+    if not main_content:
+        print("Warning: Could not find main article content")
+        return None
+    
+    content_html = main_content.decode_contents()
+    
+    # Debug: Check if content is actually extracted
+    if len(content_html.strip()) < 100:
+        print(f"Warning: Very little content extracted ({len(content_html)} chars)")
+        print(f"Content preview: {content_html[:200]}")
+        # Try to get fallback content from body
+        fallback_content = soup.body
+        if fallback_content:
+            # Remove script, style, nav, header, footer
+            for tag in fallback_content.find_all(['script', 'style', 'nav', 'header', 'footer']):
+                tag.decompose()
+            fallback_html = fallback_content.decode_contents()
+            if len(fallback_html) > len(content_html):
+                print("Using fallback body content")
+                content_html = fallback_html
+    
+    return title, content_html
+
+URL_FETCH_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1'
+}
+
+def fetch_url_page(url):
+    """Fetch an article page through the HTTP cache"""
+    print(f"Downloading URL: {url}")
+    # A page never extracted before is parsed as it downloads. One with an
+    # extraction is parsed later only if its body hash turns out to differ.
+    try:
+        parse = not extraction_cache.has_url(url)
+    except sqlite3.Error as e:
+        print(f"Could not read extraction cache: {str(e)}")
+        parse = True
+    start = time.perf_counter()
+    response = http_cache.fetch(url, headers=URL_FETCH_HEADERS, timeout=30, parse=parse)
+    # Parsing overlaps the download; report it as its own stage, not inside fetch
+    metrics.record("fetch", time.perf_counter() - start - response.parse_seconds)
+    if response.soup is not None:
+        metrics.record("parse", response.parse_seconds)
+    print(f"Page source: {'network' if response.cache_status == 'miss' else 'HTTP cache (' + response.cache_status + ')'}")
+    return response
+
+def extract_article_from_page(response, url):
+    """Extract the article from a fetched page as (title, content HTML), or None"""
+    # Unchanged source: reuse the previous extraction instead of extracting again
+    try:
+        cached = extraction_cache.get(url, response.body_hash)
+    except sqlite3.Error as e:
+        print(f"Could not read extraction cache: {str(e)}")
+        cached = None
+    if cached:
+        print("Source unchanged - using cached extraction")
+        title, content_html = cached
+    else:
+        soup = response.soup
+        if soup is None:
+            # Feed the body to lxml in chunks, decoding with the encoding sniffed from its head
+            print(f"Parsing HTML content ({response.size} bytes, {response.encoding})...")
+            with metrics.span("parse"):
+                soup = parse_chunks(response.iter_chunks(), response.encoding)
+        with metrics.span("extract"):
+            extracted = extract_article_from_soup(soup, url)
+        if not extracted:
+            return None
+        title, content_html = extracted
+        try:
+            extraction_cache.put(url, response.body_hash, title, content_html)
+        except sqlite3.Error as e:
+            print(f"Could not cache extraction: {str(e)}")
+    return title, content_html
+
+def beautiful_html_from_article(title, content_html, url):
+    """Prefetch an extracted article's images and lay it out as beautiful HTML"""
+    with metrics.span("image_prefetch"):
+        content_html = prefetch_article_images(content_html, url)
+    
+    print("Creating beautiful HTML...")
+    return create_beautiful_url_html(title, content_html)
+
+def beautiful_html_from_page(response, url):
+    """Extract the article from a fetched page and return it as beautiful HTML, or None"""
+    extracted = extract_article_from_page(response, url)
+    return beautiful_html_from_article(*extracted, url) if extracted else None
+
+def image_print_widths(soup):
+    """Most pixels each <img src> in `soup` can print at, by src; an image used more than once prints at its widest."""
+    max_widths = {}
+    for img in soup.find_all('img', src=True):
+        width = print_width(img.get('width'))
+        if width:
+            max_widths[img['src']] = max(width, max_widths.get(img['src'], 0))
+    return max_widths
+
+def prefetch_article_images(content_html, url):
+    """
+    Fetch the article's images into the asset cache, concurrently, so the
+    render serves them from disk, downscaled to the most pixels they can
+    print at. srcset/sizes and <picture> sources are dropped so Chromium
+    asks for exactly the prefetched `src`.
+    """
+    soup = BeautifulSoup(content_html, 'html.parser')
+    for source in soup.select('picture source'):
+        source.decompose()
+    images = soup.find_all('img', src=True)
+    for img in images:
+        for attr in ('srcset', 'sizes', 'loading'):
+            img.attrs.pop(attr, None)
+    counts = image_prefetcher.prefetch([img['src'] for img in images], referer=url,
+                                       max_widths=image_print_widths(soup))
+    print(f"Images: {counts['cached']} cached, {counts['fetched']} fetched, {counts['failed']} failed, "
+          f"{counts['downscaled']} downscaled for print, {counts['late']} left to the network")
+    return str(soup)
+
 def download_and_extract_url_content(url, output_path):
     """Download URL and extract clean article content for beautiful PDF creation"""
     try:
-        print(f"Downloading URL: {url}")
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1'
-        }
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
-        
-        print("Parsing HTML content...")
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        if not soup:
-            print("Error: Failed to parse HTML")
-            return False
-        
-        # Extract title and content
-        print("Extracting title...")
-        title = extract_title_from_url_content(soup)
-        print(f"Extracted title: {title}")
-        
-        print("Extracting article content...")
-        main_content = extract_article_content_from_url(soup, url)
-        if not main_content:
-            print("Warning: Could not find main article content")
+        response = fetch_url_page(url)
+        beautiful_html = beautiful_html_from_page(response, url)
+        if not beautiful_html:
             return False
         
-        print("Creating beautiful HTML...")
-        content_html = main_content.decode_contents()
-        
-        # Debug: Check if content is actually extracted
-        if len(content_html.strip()) < 100:
-            print(f"Warning: Very little content extracted ({len(content_html)} chars)")
-            print(f"Content preview: {content_html[:200]}")
-            # Try to get fallback content from body
-            fallback_content = soup.body
-            if fallback_content:
-                # Remove script, style, nav, header, footer
-                for tag in fallback_content.find_all(['script', 'style', 'nav', 'header', 'footer']):
-                    tag.decompose()
-                fallback_html = fallback_content.decode_contents()
-                if len(fallback_html) > len(content_html):
-                    print("Using fallback body content")
-                    content_html = fallback_html
-        
-        beautiful_html = create_beautiful_url_html(title, content_html)
-        
         # Save the beautiful HTML
-        with open(output_path, 'w', encoding='utf-8') as f:
+        with metrics.span("file_write"), open(output_path, 'w', encoding='utf-8') as f:
             f.write(beautiful_html)
         
         print("Successfully created beautiful HTML from URL")
         return True
         
+    except PageTooLargeError:
+        raise
     except Exception as e:
         print(f"Error downloading/extracting URL content: {str(e)}")
         return False
 
-async def html_to_pdf_beautiful_url(source, pdf_file):
-    """Convert beautiful URL HTML to PDF with uniform margins and proper image loading"""
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        page = await browser.new_page()
+async def html_to_pdf_beautiful_url(source, pdf_file, report=None):
+    """
+    Convert beautiful URL HTML to PDF with uniform margins and proper image loading.
+    If `report` is a dict, the readiness waits and request filter counts are recorded in it.
+    With `pdf_file` None the PDF bytes are returned; otherwise the PDF is
+    streamed to `pdf_file` (a path or a chunk callback) and its size returned.
+    """
+    async with get_browser_pool().context() as context:
+        page = await context.new_page()
+        readiness = await PageReadiness.attach(page)
+        request_filter = await RequestFilter.attach(page, await source_image_assets(source))
+        if report is not None:
+            report["readiness"] = readiness.history
+            report["requests"] = request_filter.counts
         
         try:
             # Set a longer timeout for image loading
             page.set_default_timeout(60000)
             
-            if source.startswith('http'):
-                await page.goto(source, wait_until='networkidle', timeout=30000)
-            else:
-                await page.goto(f"file:///{os.path.abspath(source)}", wait_until='networkidle', timeout=30000)
+            await open_source(page, source)
             
-            # Wait longer for images to load and force image loading
-            await page.wait_for_timeout(5000)
+            # Wait until every image is decoded and layout has settled
+            await readiness.wait("load")
             
             # Simplified image loading - let browser handle naturally
             await page.evaluate("""
@@ -1527,8 +2117,8 @@ async def html_to_pdf_beautiful_url(source, pdf_file):
                 }
             """)
             
-            # Additional wait after image loading
-            await page.wait_for_timeout(3000)
+            # Confirm the layout is still stable after the image check
+            await readiness.wait("images")
             
             # Inject CSS to ensure proper margins and colors
             await page.add_style_tag(content='''
@@ -1579,28 +2169,60 @@ async def html_to_pdf_beautiful_url(source, pdf_file):
             ''')
             
             # Generate PDF with 2cm margins as required by PRD
-            await page.pdf(
-                path=pdf_file,
-                format='A4',
-                print_background=True,
-                margin={
-                    "top": "0.787in",    # 2cm = 0.787in
-                    "right": "0.787in",  # 2cm = 0.787in
-                    "bottom": "0.787in", # 2cm = 0.787in
-                    "left": "0.787in"    # 2cm = 0.787in
-                },
-                prefer_css_page_size=True,
-                display_header_footer=False
-            )
+            with metrics.span("pdf_print"):
+                pdf_result = await print_pdf(
+                    page, pdf_file,
+                    format='A4',
+                    print_background=True,
+                    margin={
+                        "top": "0.787in",    # 2cm = 0.787in
+                        "right": "0.787in",  # 2cm = 0.787in
+                        "bottom": "0.787in", # 2cm = 0.787in
+                        "left": "0.787in"    # 2cm = 0.787in
+                    },
+                    prefer_css_page_size=True,
+                    display_header_footer=False
+                )
             
             print("Beautiful URL PDF generated successfully with uniform margins")
+            return pdf_result
             
-        finally:
-            await browser.close()
+        except Exception as e:
+            print(f"Error during beautiful URL conversion: {str(e)}")
+            raise
+
+
+# --- BATCH CONVERSION ---
+def batch_fetch(item):
+    item["page"] = fetch_url_page(item["url"])
+
+def batch_extract(item):
+    item["article"] = extract_article_from_page(item.pop("page"), item["url"])
+    if not item["article"]:
+        raise Exception("Could not find the main article content")
+
+def batch_images(item):
+    beautiful_html = beautiful_html_from_article(*item.pop("article"), item["url"])
+    with metrics.span("file_write"), open(item["html_path"], 'w', encoding='utf-8') as f:
+        f.write(beautiful_html)
+
+def batch_render(item):
+    render_with_budget(html_to_pdf_beautiful_url(item["html_path"], item["pdf_path"]))
+    if not os.path.exists(item["pdf_path"]) or os.path.getsize(item["pdf_path"]) == 0:
+        raise Exception("PDF file was not created or is empty")
+
+# One pipeline for every batch, so the per-stage limits hold across requests
+batch_pipeline = StagePipeline([
+    ("fetch", batch_fetch, BATCH_FETCH_WORKERS),
+    ("extract", batch_extract, BATCH_EXTRACT_WORKERS),
+    ("images", batch_images, BATCH_IMAGE_WORKERS),
+    ("render", batch_render, BATCH_RENDER_WORKERS)
+])
 
 
 # --- FLASK ROUTES ---
 @app.route("/", methods=["GET", "POST"])
+@with_server_timing
 def index():
     if request.method == "POST":
         url_input = request.form.get("url", "").strip()
@@ -1614,7 +2236,15 @@ def index():
             html_path = os.path.join("uploads", filename)
             
             # Use the new beautiful URL content extraction
-            if download_and_extract_url_content(url_input, html_path):
+            try:
+                with admission.admitted():
+                    extracted = download_and_extract_url_content(url_input, html_path)
+            except QueueFullError as e:
+                return render_template("index.html", error=str(e), uploaded=False), 429, {"Retry-After": str(e.retry_after)}
+            except PageTooLargeError as e:
+                return render_template("index.html", error=str(e), uploaded=False), 413
+
+            if extracted:
                 return render_template("index.html", 
                     filename=filename, 
                     display_name=f"{domain}.html", 
@@ -1644,6 +2274,102 @@ def index():
 
 
 
+@app.route("/cache/stats")
+def cache_stats():
+    """Hit/miss counters and sizes for every cache layer."""
+    return jsonify({
+        "pdf": pdf_cache.stats(),
+        "http": http_cache.stats(),
+        "extraction": extraction_cache.stats(),
+        "assets": image_prefetcher.cache.stats()
+    })
+
+@app.route("/convert/batch", methods=["POST"])
+def convert_batch():
+    """
+    Convert a list of URLs (JSON {"urls": [...]} or a newline-separated `urls`
+    form field) to PDFs. Items move through fetch, extract, images and render stages
+    concurrently, and the response streams a ZIP of the PDFs as they finish,
+    ending with manifest.json describing every item's status and timings.
+    A batch holds one admission until its response is closed, and is
+    rejected with 429 when the server is full.
+    """
+    if request.is_json:
+        payload = request.get_json(silent=True)
+        urls = payload.get("urls") if isinstance(payload, dict) else None
+        if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+            return jsonify({"error": "urls must be a list of strings."}), 400
+    else:
+        urls = request.form.get("urls", "").split()
+    urls = [url.strip() for url in urls if url.strip()]
+    if not urls:
+        return jsonify({"error": "Provide a list of URLs."}), 400
+    if len(urls) > BATCH_MAX_URLS:
+        return jsonify({"error": f"At most {BATCH_MAX_URLS} URLs per batch."}), 400
+
+    try:
+        admission.admit()
+    except QueueFullError as e:
+        print(f"✗ Rejected batch of {len(urls)} URLs: {str(e)}")
+        return busy_response(e)
+
+    batch_id = uuid.uuid4().hex
+    workdir = os.path.join("uploads", f"batch_{batch_id}")
+    os.makedirs(workdir, exist_ok=True)
+
+    items = []
+    for index, url in enumerate(urls, 1):
+        domain = re.sub(r'[^\w.-]', '_', urlparse(url).netloc.replace('www.', '')) or 'page'
+        name = f"{index:03d}_{domain}"
+        item = {
+            "index": index,
+            "url": url,
+            "pdf": f"{name}.pdf",
+            "html_path": os.path.join(workdir, f"{name}.html"),
+            "pdf_path": os.path.join(workdir, f"{name}.pdf")
+        }
+        if not is_valid_url(url):
+            item.update(status="failed", error="Invalid URL")
+        items.append(item)
+    print(f"Batch {batch_id}: {len(items)} URLs")
+
+    def entries():
+        manifest = []
+        try:
+            for item in batch_pipeline.run(items):
+                if item["status"] == "done":
+                    yield item["pdf"], item["pdf_path"]
+                print(f"{'✓' if item['status'] == 'done' else '✗'} Batch {batch_id} item {item['index']}: {item['status']}")
+                manifest.append({
+                    "index": item["index"],
+                    "url": item["url"],
+                    "status": item["status"],
+                    "pdf": item["pdf"] if item["status"] == "done" else None,
+                    "error": item["error"],
+                    "timings": item["timings"]
+                })
+            manifest.sort(key=lambda entry: entry["index"])
+            summary = {
+                "batch_id": batch_id,
+                "total": len(manifest),
+                "succeeded": sum(1 for entry in manifest if entry["status"] == "done"),
+                "items": manifest
+            }
+            yield "manifest.json", json.dumps(summary, indent=2).encode("utf-8")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    response = Response(stream_zip(entries()), mimetype="application/zip",
+                        headers={"Content-Disposition": f'attachment; filename="batch_{batch_id}.zip"'})
+    # Runs even when the client goes away before the stream starts
+    response.call_on_close(admission.release)
+    return response
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Stage duration histograms, queue and render gauges and cache hit ratios for Prometheus."""
+    return Response(metrics.registry.expose(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/download/<filename>")
 def download_pdf(filename):
     pdf_path = os.path.join("uploads", filename)
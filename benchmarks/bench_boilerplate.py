@@ -0,0 +1,131 @@
+"""
+Benchmark the single-pass boilerplate classifier against the per-pattern
+find_all loops it replaced.
+
+Usage:
+    python benchmarks/bench_boilerplate.py [--sections 2000] [--repeat 5]
+
+Runs over the saved pages in uploads/ and test_brightdata_debug.html plus a
+synthetic page with --sections boilerplate-heavy blocks, checks that both
+approaches produce identical trees, and reports tree traversals, elements
+visited and median time for each.
+"""
+import argparse
+import glob
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import URL_BOILERPLATE_TAGS, URL_BOILERPLATE_PATTERNS, url_boilerplate  # noqa: E402
+from playwright_extractor import (  # noqa: E402
+    ARTICLE_BOILERPLATE_TAGS, ARTICLE_BOILERPLATE_PATTERNS, article_boilerplate
+)
+
+
+def legacy_strip(soup, tag_names, patterns, count=False):
+    """
+    The original loops: one find_all per tag name, two per pattern.
+    With `count`, also tallies the elements each find_all walks (untimed runs only).
+    """
+    traversals = 0
+    visited = 0
+    for tag_name in tag_names:
+        traversals += 1
+        if count:
+            visited += len(soup.find_all(True))
+        for tag in soup.find_all(tag_name):
+            tag.decompose()
+    for pattern in patterns:
+        for attr in ('class_', 'id'):
+            traversals += 1
+            if count:
+                visited += len(soup.find_all(True))
+            for element in soup.find_all(**{attr: re.compile(pattern, re.I)}):
+                element.decompose()
+    return traversals, visited
+
+
+def synthetic_page(sections):
+    random.seed(42)
+    words = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor".split()
+    classes = ['card', 'story', 'promo-box', 'related-links', 'content', 'share-bar', 'ad', 'widget', 'body-copy']
+    parts = ['<html><head><title>Synthetic</title><script>var x=1;</script></head><body><nav class="menu">Menu</nav>']
+    for i in range(sections):
+        parts.append(f'<div class="{random.choice(classes)}" id="block-{i}"><section><h2>Heading {i}</h2>')
+        for _ in range(random.randint(1, 4)):
+            parts.append('<p>' + ' '.join(random.choice(words) for _ in range(40)) + ' <a href="#">link</a></p>')
+        parts.append('<form><input type="text"><button>Go</button></form></section></div>')
+    parts.append('<footer>Footer</footer></body></html>')
+    return ''.join(parts)
+
+
+def time_median(fn, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        soup = fn.setup()
+        started = time.perf_counter()
+        result = fn(soup)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), result, soup
+
+
+def run(name, html, tag_names, patterns, classifier, repeat):
+    def legacy(soup):
+        return legacy_strip(soup, tag_names, patterns)
+
+    def single_pass(soup):
+        removed, visited = classifier.strip(soup)
+        return 1, visited
+
+    legacy.setup = single_pass.setup = lambda: BeautifulSoup(html, 'html.parser')
+
+    legacy_time, _, legacy_soup = time_median(legacy, repeat)
+    new_time, (new_traversals, new_visited), new_soup = time_median(single_pass, repeat)
+    legacy_traversals, legacy_visited = legacy_strip(legacy.setup(), tag_names, patterns, count=True)
+    identical = str(legacy_soup) == str(new_soup)
+
+    print(f"{name:<40} {len(html) / 1024:>6.0f}KB "
+          f"{legacy_traversals:>5} / {new_traversals:<3} "
+          f"{legacy_visited:>9} / {new_visited:<7} "
+          f"{legacy_time * 1000:>8.1f} / {new_time * 1000:<7.1f} "
+          f"{legacy_time / new_time:>6.1f}x  {'ok' if identical else 'MISMATCH'}")
+    return identical
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sections', type=int, default=2000, help='blocks in the synthetic page')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per measurement (median is reported)')
+    args = parser.parse_args()
+
+    pages = [(os.path.basename(path)[-30:], open(path, encoding='utf-8', errors='replace').read())
+             for path in sorted(glob.glob(os.path.join(ROOT, 'uploads', '*.html')))
+             + [os.path.join(ROOT, 'test_brightdata_debug.html')]]
+    pages.append((f'synthetic ({args.sections} sections)', synthetic_page(args.sections)))
+
+    classifiers = [
+        ('app', URL_BOILERPLATE_TAGS, URL_BOILERPLATE_PATTERNS, url_boilerplate),
+        ('extractor', ARTICLE_BOILERPLATE_TAGS, ARTICLE_BOILERPLATE_PATTERNS, article_boilerplate),
+    ]
+
+    print(f"{'page [classifier]':<40} {'size':>8} {'traversals':>11} {'elements visited':>19} "
+          f"{'time ms (legacy / new)':>22}")
+    all_identical = True
+    for page_name, html in pages:
+        for classifier_name, tag_names, patterns, classifier in classifiers:
+            all_identical &= run(f"{page_name} [{classifier_name}]", html, tag_names, patterns,
+                                 classifier, args.repeat)
+    sys.exit(0 if all_identical else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Benchmark direct screenshot-to-PDF assembly against the HTML round-trip it
+replaced in html_to_pdf_screenshot_approach.
+
+Usage:
+    python benchmarks/bench_raster_pdf.py [--heights 2000 5000 15000] [--repeat 5]
+
+Builds a synthetic 800px-wide RGBA screenshot PNG for each height and times
+both ways of turning it into a PDF: the old one (base64 data URI in an HTML
+document, loaded into Chromium and printed) and RasterPdfWriter. Peak Python
+allocations are measured with tracemalloc. When Chromium cannot be launched
+the old path is timed up to the HTML document only, which understates its
+cost.
+"""
+import argparse
+import base64
+import contextlib
+import io
+import os
+import random
+import statistics
+import struct
+import sys
+import time
+import tracemalloc
+import zlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Skip the Playwright install check that runs when app.py is imported.
+os.environ.setdefault('WERKZEUG_RUN_MAIN', 'true')
+
+from browser_pool import get_browser_pool  # noqa: E402
+from raster_pdf import RasterPdfWriter, load_image  # noqa: E402
+
+WIDTH = 800
+MARGIN_INCHES = 0.3
+
+
+def synthetic_screenshot(height):
+    """An opaque RGBA PNG of white rows and noisy text-like bands, about as compressible as a real page."""
+    rng = random.Random(42)
+    white = b'\xff\xff\xff\xff' * WIDTH
+    rows = []
+    for y in range(height):
+        if (y // 6) % 4 == 1:
+            gray = rng.randbytes(WIDTH)
+            rows.append(b'\x00' + bytes(b for value in gray for b in (value, value, value, 255)))
+        else:
+            rows.append(b'\x00' + white)
+    rows = b''.join(rows)
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', WIDTH, height, 8, 6, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b''))
+
+
+def old_html(png, height):
+    content_width, content_height = WIDTH / 96, height / 96
+    image_data = base64.b64encode(png).decode('utf-8')
+    return f'''<!DOCTYPE html><html><head><style>
+        @page {{ size: {content_width + 2 * MARGIN_INCHES:.6f}in {content_height + 2 * MARGIN_INCHES:.6f}in; margin: 0; }}
+        body {{ margin: {MARGIN_INCHES}in; padding: 0; }}
+        img {{ width: {content_width:.6f}in; height: {content_height:.6f}in; display: block; }}
+    </style></head><body><img src="data:image/png;base64,{image_data}" /></body></html>'''
+
+
+async def old_pdf(png, height):
+    html = old_html(png, height)
+    async with get_browser_pool().context() as context:
+        page = await context.new_page()
+        await page.set_content(html, wait_until='load')
+        return await page.pdf(width=f"{WIDTH / 96 + 2 * MARGIN_INCHES:.6f}in",
+                              height=f"{height / 96 + 2 * MARGIN_INCHES:.6f}in",
+                              print_background=True, prefer_css_page_size=True)
+
+
+def new_pdf(png, height):
+    writer = RasterPdfWriter()
+    writer.begin_page((WIDTH / 96 + 2 * MARGIN_INCHES) * 72, (height / 96 + 2 * MARGIN_INCHES) * 72)
+    writer.draw_image(load_image(png, opaque=True), MARGIN_INCHES * 72, MARGIN_INCHES * 72,
+                      WIDTH * 0.75, height * 0.75)
+    writer.close()
+    return b''.join(writer.drain())
+
+
+def measure(fn, repeat):
+    """Median seconds, peak traced MB and output size of fn()."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    tracemalloc.start()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(samples), peak / (1024 * 1024), len(result)
+
+
+def browser_available():
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            get_browser_pool().start()
+        return True
+    except Exception as e:
+        print(f'Chromium unavailable ({type(e).__name__}); timing the old path up to its HTML document only.')
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--heights', type=int, nargs='+', default=[2000, 5000, 15000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    render = browser_available()
+    print(f"{'height':>7} {'PNG':>9} {'old':>10} {'old peak':>9} {'new':>10} {'new peak':>9} {'PDF':>9} {'speedup':>8}")
+    for height in args.heights:
+        png = synthetic_screenshot(height)
+        if render:
+            old = measure(lambda: get_browser_pool().run(old_pdf(png, height), timeout=120), args.repeat)
+        else:
+            old = measure(lambda: old_html(png, height).encode('utf-8'), args.repeat)
+        new = measure(lambda: new_pdf(png, height), args.repeat)
+        print(f"{height:>7} {len(png) / 1024:>7.0f}KB {old[0] * 1000:>8.2f}ms {old[1]:>7.1f}MB "
+              f"{new[0] * 1000:>8.2f}ms {new[1]:>7.1f}MB {new[2] / 1024:>7.0f}KB {old[0] / new[0]:>7.1f}x")
+    if render:
+        get_browser_pool().shutdown()
+
+
+if __name__ == '__main__':
+    main()
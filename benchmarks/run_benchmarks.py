@@ -0,0 +1,304 @@
+"""
+Stage-level benchmark of the URL-to-PDF pipeline over a corpus of saved pages.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--repeat 5] [--corpus DIR ...]
+                                        [--output FILE] [--compare FILE]
+                                        [--threshold 0.2] [--no-render]
+
+Serves every page in uploads/, test_brightdata_debug.html and any --corpus
+directories from a local stand-in server, then times each stage per page:
+fetch, parse, title (extract_title_from_url_content), extract
+(extract_article_content_from_url), beautiful_html (create_beautiful_url_html)
+and the render paths (intelligent, screenshot and beautiful_url). Render
+stages are skipped with a note when Chromium cannot be launched.
+
+Reports p50/p95 latency, the benchmark process's RSS high-water mark after
+each stage and the output PDF size per render method. The high-water mark
+only ever rises over a run, so it shows which stage first pushed memory up,
+not what each stage uses, and it leaves out Chromium's child processes. On
+Windows it needs psutil and is reported as unavailable without it.
+
+Results are written as JSON (by default to benchmarks/results/<commit>.json).
+With --compare, p50 latencies are checked against an earlier result file and
+the run exits 1 if any stage slowed down by more than --threshold.
+"""
+import argparse
+import contextlib
+import glob
+import http.server
+import io
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Skip the Playwright install check that runs when app.py is imported.
+os.environ.setdefault('WERKZEUG_RUN_MAIN', 'true')
+
+import app  # noqa: E402
+from browser_pool import get_browser_pool  # noqa: E402
+from html_stream import parse_chunks  # noqa: E402
+from http_cache import HttpCache  # noqa: E402
+
+# Slowdowns smaller than this are timer noise, whatever the ratio.
+MIN_REGRESSION_MS = 0.5
+RENDER_METHODS = {
+    'intelligent': lambda source, pdf: app.html_to_pdf_exact_replica(source, pdf, margin_inches=0.3),
+    'screenshot': lambda source, pdf: app.html_to_pdf_screenshot_approach(source, pdf, margin_inches=0.3),
+    'beautiful_url': lambda source, pdf: app.html_to_pdf_beautiful_url(source, pdf),
+}
+
+
+def default_corpus():
+    pages = sorted(glob.glob(os.path.join(ROOT, 'uploads', '*.html')))
+    pages.append(os.path.join(ROOT, 'test_brightdata_debug.html'))
+    return pages
+
+
+def rss_high_water_mb():
+    """
+    Highest RSS this process has reached so far (not counting child processes),
+    or None where it cannot be measured.
+    """
+    try:
+        import resource
+    except ImportError:
+        # Windows: psutil's peak working set, when psutil happens to be installed
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+        except (ImportError, AttributeError):
+            return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes elsewhere.
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile."""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def summarize(samples_ms):
+    return {
+        'p50_ms': round(percentile(samples_ms, 0.50), 3),
+        'p95_ms': round(percentile(samples_ms, 0.95), 3),
+        'runs': len(samples_ms),
+    }
+
+
+class CorpusServer:
+    """Serves the corpus files by basename on an ephemeral localhost port."""
+
+    def __init__(self, pages):
+        files = {os.path.basename(path): path for path in pages}
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = files.get(self.path.lstrip('/'))
+                if not path:
+                    self.send_error(404)
+                    return
+                with open(path, 'rb') as f:
+                    body = f.read()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('Cache-Control', 'no-store')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def url_for(self, path):
+        return f'http://127.0.0.1:{self.httpd.server_port}/{os.path.basename(path)}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.rss = {}
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        # Pipeline code logs with print(); keep it out of the report.
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+        self.samples.setdefault(stage, []).append((time.perf_counter() - start) * 1000)
+        self.note_rss(stage, rss_high_water_mb())
+
+    def note_rss(self, stage, rss):
+        """Keep the highest RSS seen after `stage`; None means it could not be measured."""
+        self.rss[stage] = None if rss is None else max(self.rss.get(stage) or 0.0, rss)
+
+    def report(self):
+        return {stage: dict(summarize(samples),
+                            rss_high_water_mb=None if self.rss[stage] is None else round(self.rss[stage], 1))
+                for stage, samples in self.samples.items()}
+
+
+def run_pipeline(url, recorder, workdir):
+    """One pass over the CPU stages for one page. Returns the beautiful HTML path."""
+    with recorder.time('fetch'):
+        # A fresh cache directory every pass, so each fetch goes to the server.
+        page = HttpCache(tempfile.mkdtemp(dir=workdir), 50 * 1024 * 1024).fetch(url)
+    with recorder.time('parse'):
+        soup = parse_chunks(page.iter_chunks(), page.encoding)
+    with recorder.time('title'):
+        title = app.extract_title_from_url_content(soup)
+    with recorder.time('extract'):
+        main_content = app.extract_article_content_from_url(soup, url)
+    content_html = main_content.decode_contents() if main_content else ''
+    with recorder.time('beautiful_html'):
+        beautiful = app.create_beautiful_url_html(title, content_html)
+    beautiful_path = os.path.join(workdir, 'beautiful.html')
+    with open(beautiful_path, 'w', encoding='utf-8') as f:
+        f.write(beautiful)
+    return beautiful_path
+
+
+def browser_available():
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            get_browser_pool().start()
+        return True, None
+    except Exception as e:
+        return False, f'{type(e).__name__}: {str(e).splitlines()[0]}'
+
+
+def run_render(method, source, recorder, workdir, pdf_sizes):
+    pdf_path = os.path.join(workdir, f'{method}.pdf')
+    with recorder.time(f'render_{method}'):
+        get_browser_pool().run(RENDER_METHODS[method](source, pdf_path), timeout=app.RENDER_TIMEOUT_SECONDS)
+    pdf_sizes.setdefault(method, []).append(os.path.getsize(pdf_path))
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+    print(f"\nAgainst {baseline_path} (commit {baseline.get('commit', '?')}):")
+    print(f"{'stage':<24} {'before p50':>12} {'after p50':>12} {'change':>9}")
+    for stage, after in results['stages'].items():
+        before = baseline.get('stages', {}).get(stage)
+        if not before or not before['p50_ms']:
+            continue
+        change = after['p50_ms'] / before['p50_ms'] - 1
+        slower = change > threshold and after['p50_ms'] - before['p50_ms'] > MIN_REGRESSION_MS
+        flag = '  <-- regression' if slower else ''
+        print(f"{stage:<24} {before['p50_ms']:>10.2f}ms {after['p50_ms']:>10.2f}ms {change:>+8.0%}{flag}")
+        if flag:
+            regressions.append(stage)
+    return regressions
+
+
+def print_report(results):
+    print(f"{'stage':<24} {'p50':>10} {'p95':>10} {'RSS HWM':>10}")
+    for stage, row in results['stages'].items():
+        rss = 'n/a' if row['rss_high_water_mb'] is None else f"{row['rss_high_water_mb']:.1f}MB"
+        print(f"{stage:<24} {row['p50_ms']:>8.2f}ms {row['p95_ms']:>8.2f}ms {rss:>10}")
+    for method, row in results['pdf_bytes'].items():
+        print(f"PDF size ({method}): {row['mean']:.0f} bytes mean, {row['max']} max")
+    if results['render_skipped']:
+        print(f"Render stages skipped: {results['render_skipped']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='passes per page (p50/p95 over all passes)')
+    parser.add_argument('--corpus', action='append', default=[], help='extra directory of .html pages')
+    parser.add_argument('--output', help='result file (default benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', help='earlier result file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed p50 slowdown before failing')
+    parser.add_argument('--no-render', action='store_true', help='skip the browser render stages')
+    args = parser.parse_args()
+
+    pages = default_corpus()
+    for directory in args.corpus:
+        pages.extend(sorted(glob.glob(os.path.join(directory, '*.html'))))
+
+    if args.no_render:
+        render_ok, render_skipped = False, '--no-render'
+    else:
+        render_ok, render_skipped = browser_available()
+
+    overall = Recorder()
+    per_page = {}
+    pdf_sizes = {}
+    with CorpusServer(pages) as server, tempfile.TemporaryDirectory() as workdir:
+        for path in pages:
+            name = os.path.basename(path)
+            print(f'{name}...')
+            recorder = Recorder()
+            for _ in range(args.repeat):
+                beautiful_path = run_pipeline(server.url_for(path), recorder, workdir)
+                if render_ok:
+                    run_render('intelligent', path, recorder, workdir, pdf_sizes)
+                    run_render('screenshot', path, recorder, workdir, pdf_sizes)
+                    run_render('beautiful_url', beautiful_path, recorder, workdir, pdf_sizes)
+            for stage, samples in recorder.samples.items():
+                overall.samples.setdefault(stage, []).extend(samples)
+                overall.note_rss(stage, recorder.rss[stage])
+            per_page[name] = recorder.report()
+
+    if render_ok:
+        get_browser_pool().shutdown()
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'pages': [os.path.relpath(path, ROOT) for path in pages],
+        'stages': overall.report(),
+        'per_page': per_page,
+        'pdf_bytes': {method: {'mean': sum(sizes) / len(sizes), 'max': max(sizes)}
+                      for method, sizes in pdf_sizes.items()},
+        'render_skipped': render_skipped,
+    }
+
+    print()
+    print_report(results)
+
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results', f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'\nResults written to {output}')
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
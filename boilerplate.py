@@ -0,0 +1,49 @@
+import re
+
+from bs4 import Tag
+
+
+class BoilerplateClassifier:
+    """
+    Single-pass remover for non-article elements.
+
+    A tag is boilerplate when its name is one of `tag_names`, or when its
+    class or id matches any of `patterns`. All patterns are compiled into one
+    alternation up front, so `strip()` decides every element with a single
+    walk of the tree instead of one full-tree search per pattern.
+    """
+
+    def __init__(self, tag_names, patterns):
+        self.tag_names = frozenset(tag_names)
+        self.patterns = list(patterns)
+        self.matcher = re.compile("|".join(f"(?:{pattern})" for pattern in self.patterns), re.I)
+
+    def is_boilerplate(self, tag):
+        if tag.name in self.tag_names:
+            return True
+        classes = tag.get("class")
+        if classes:
+            if not isinstance(classes, str):
+                classes = " ".join(classes)
+            if self.matcher.search(classes):
+                return True
+        tag_id = tag.get("id")
+        return bool(tag_id and self.matcher.search(tag_id))
+
+    def strip(self, soup):
+        """
+        Remove every boilerplate element from `soup` in one tree walk.
+        Returns (elements removed, elements visited).
+        """
+        removed = visited = 0
+        stack = [child for child in reversed(soup.contents) if isinstance(child, Tag)]
+        while stack:
+            tag = stack.pop()
+            visited += 1
+            if self.is_boilerplate(tag):
+                # Descendants go with it, so there is no need to visit them.
+                tag.decompose()
+                removed += 1
+                continue
+            stack.extend(child for child in reversed(tag.contents) if isinstance(child, Tag))
+        return removed, visited
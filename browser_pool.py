@@ -0,0 +1,203 @@
+import asyncio
+import atexit
+import contextvars
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+
+from playwright.async_api import async_playwright
+
+import metrics
+
+
+# --- POOL CONFIGURATION ---
+# Every setting can be overridden per deployment through the environment.
+POOL_SIZE = int(os.environ.get("PDF_BROWSER_POOL_SIZE", "2"))
+MAX_RENDERS_PER_BROWSER = int(os.environ.get("PDF_BROWSER_MAX_RENDERS", "100"))
+# Per-renderer JavaScript heap budget, so one pathological page runs out of
+# memory on its own instead of taking the whole box down.
+RENDER_JS_HEAP_MB = int(os.environ.get("PDF_RENDER_JS_HEAP_MB", "512"))
+LAUNCH_ARGS = ["--disable-dev-shm-usage", f"--js-flags=--max-old-space-size={RENDER_JS_HEAP_MB}"]
+
+
+class _PooledBrowser:
+    """A warm Chromium instance plus the bookkeeping needed to recycle it."""
+
+    def __init__(self, browser):
+        self.browser = browser
+        self.renders = 0
+        self.retire = False
+
+
+class BrowserPool:
+    """
+    Long-lived pool of warm Chromium browsers for one worker process.
+
+    Playwright objects are bound to the event loop that created them, so the
+    pool owns a dedicated loop running in a background thread. Callers hand
+    coroutines to `run()`, and the coroutines borrow a fresh, isolated browser
+    context with `async with pool.context() as context:`.
+    """
+
+    def __init__(self, size=POOL_SIZE, max_renders=MAX_RENDERS_PER_BROWSER, launch_args=None):
+        self.size = max(1, size)
+        self.max_renders = max(1, max_renders)
+        self.launch_args = launch_args or LAUNCH_ARGS
+        self._loop = None
+        self._thread = None
+        self._playwright = None
+        self._idle = None
+        self._start_lock = threading.Lock()
+        self._stats = {"launched": 0, "recycled": 0, "unhealthy": 0, "renders": 0}
+
+    # --- LIFECYCLE ---
+    def start(self):
+        """Start the pool loop and launch the browsers (idempotent)."""
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="browser-pool", daemon=True)
+            thread.start()
+            self._loop, self._thread = loop, thread
+            try:
+                asyncio.run_coroutine_threadsafe(self._start(), loop).result()
+            except Exception:
+                self._stop_loop()
+                raise
+        print(f"Browser pool ready: {self.size} warm Chromium instance(s)")
+
+    async def _start(self):
+        self._playwright = await async_playwright().start()
+        self._idle = asyncio.Queue()
+        for _ in range(self.size):
+            self._idle.put_nowait(await self._launch())
+
+    async def _launch(self):
+        browser = await self._playwright.chromium.launch(headless=True, args=self.launch_args)
+        self._stats["launched"] += 1
+        return _PooledBrowser(browser)
+
+    def shutdown(self):
+        """Close every browser and stop the pool loop."""
+        if self._loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout=30)
+        except Exception as e:
+            print(f"Error shutting down browser pool: {str(e)}")
+        self._stop_loop()
+
+    async def _shutdown(self):
+        while not self._idle.empty():
+            pooled = self._idle.get_nowait()
+            try:
+                await pooled.browser.close()
+            except Exception:
+                pass
+        await self._playwright.stop()
+
+    def _stop_loop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop, self._thread = None, None
+
+    # --- RENDERING ---
+    def run(self, coro, timeout=None):
+        """
+        Run a render coroutine on the pool loop and block until it finishes.
+        With a `timeout` the render is cancelled once it runs over budget and
+        asyncio.TimeoutError is raised.
+        """
+        try:
+            self.start()
+        except Exception:
+            coro.close()
+            raise
+        if timeout is not None:
+            coro = asyncio.wait_for(coro, timeout)
+        coro = self._in_context(contextvars.copy_context(), coro)
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    @staticmethod
+    async def _in_context(context, coro):
+        # Tasks on the pool loop start from the loop thread's context; carry the
+        # caller's variables (such as its timing collector) into the render.
+        for var, value in context.items():
+            var.set(value)
+        return await coro
+
+    @asynccontextmanager
+    async def context(self, **context_options):
+        """
+        Borrow a healthy browser and yield a brand new context on it.
+
+        The context is closed afterwards, so no cookies, storage or cache leak
+        between renders. Browsers are relaunched once they have served
+        `max_renders` renders or fail a health check.
+        """
+        started = time.perf_counter()
+        pooled = await self._idle.get()
+        context = None
+        try:
+            pooled = await self._ensure_healthy(pooled)
+            context = await pooled.browser.new_context(**context_options)
+            metrics.record("browser_acquire", time.perf_counter() - started)
+            yield context
+        except BaseException:
+            # A failed or cancelled render may have left Chromium wedged; start afresh next time.
+            pooled.retire = True
+            raise
+        finally:
+            if context is not None:
+                try:
+                    await context.close()
+                except Exception:
+                    pooled.retire = True
+            pooled.renders += 1
+            self._stats["renders"] += 1
+            await self._release(pooled)
+
+    async def _ensure_healthy(self, pooled):
+        if pooled.browser.is_connected():
+            return pooled
+        print("Pooled browser disconnected, relaunching...")
+        self._stats["unhealthy"] += 1
+        return await self._launch()
+
+    async def _release(self, pooled):
+        if pooled.retire or pooled.renders >= self.max_renders:
+            self._stats["recycled"] += 1
+            try:
+                await pooled.browser.close()
+            except Exception:
+                pass
+            try:
+                pooled = await self._launch()
+            except Exception as e:
+                # Keep the slot; the next borrower will retry the launch.
+                print(f"Failed to relaunch pooled browser: {str(e)}")
+                pooled.retire = True
+                self._idle.put_nowait(pooled)
+                return
+        self._idle.put_nowait(pooled)
+
+    def stats(self):
+        """Return pool counters for diagnostics."""
+        idle = self._idle.qsize() if self._idle is not None else 0
+        return dict(self._stats, size=self.size, idle=idle, started=self._loop is not None)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_browser_pool():
+    """Return this process's browser pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool()
+            atexit.register(_pool.shutdown)
+        return _pool
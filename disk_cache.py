@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+
+class DiskCache:
+    """
+    A directory of files keyed by hex digest, capped at `max_bytes`.
+
+    Reads refresh a file's mtime, so eviction removes the least recently
+    used files first once the directory grows past its size budget.
+    """
+
+    def __init__(self, directory, max_bytes, suffix=""):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in self._entries())
+
+    def _entries(self):
+        return [entry for entry in os.scandir(self.directory)
+                if entry.is_file() and entry.name.endswith(self.suffix) and not entry.name.startswith(".")]
+
+    def path_for(self, key):
+        return os.path.join(self.directory, f"{key}{self.suffix}")
+
+    def get(self, key):
+        """Return the cached file's path and mark it as recently used, or None."""
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._misses += 1
+            return None
+        with self._lock:
+            self._hits += 1
+        return path
+
+    def put_file(self, key, source_path):
+        """Copy `source_path` into the cache under `key` and return the cached path."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as tmp, open(source_path, "rb") as source:
+            shutil.copyfileobj(source, tmp)
+        return self._commit(key, tmp_path)
+
+    def put_bytes(self, key, data):
+        """Store `data` in the cache under `key` and return the cached path."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as tmp:
+            tmp.write(data)
+        return self._commit(key, tmp_path)
+
+    @contextmanager
+    def writer(self, key):
+        """
+        Yield a file to write an entry into piece by piece. It is stored under
+        `key` when the block finishes, and discarded if the block raises.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                yield tmp
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self._commit(key, tmp_path)
+
+    def _commit(self, key, tmp_path):
+        path = self.path_for(key)
+        with self._lock:
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            try:
+                os.replace(tmp_path, path)
+            except OSError:
+                # e.g. the old file is still open on Windows; don't leave the temp file behind
+                os.remove(tmp_path)
+                raise
+            self._size += os.path.getsize(path) - replaced
+            if self._size > self.max_bytes:
+                self._evict()
+        return path
+
+    def _evict(self):
+        """Remove least recently used files until the cache fits its budget."""
+        entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime)
+        self._size = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self._size <= self.max_bytes:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self._size -= size
+            except OSError:
+                continue
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": self._hits / lookups if lookups else 0.0,
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,117 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+# --- EXTRACTION CACHE CONFIGURATION ---
+EXTRACTION_CACHE_PATH = os.environ.get("EXTRACTION_CACHE_PATH", os.path.join("cache", "extraction.sqlite3"))
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.environ.get("EXTRACTION_CACHE_MAX_ENTRIES", "5000"))
+# How long a write waits for another process's write lock before giving up.
+EXTRACTION_CACHE_BUSY_TIMEOUT_MS = int(os.environ.get("EXTRACTION_CACHE_BUSY_TIMEOUT_MS", "2000"))
+
+
+class ExtractionCache:
+    """
+    Persistent SQLite cache of cleaned article output.
+
+    Rows are keyed by URL, a hash of the fetched body and the extractor
+    `version`, so a page whose source has not changed never goes through
+    parsing and extraction again, until the extraction logic itself does.
+    Only the newest row per URL is kept, and the least recently used rows
+    are dropped beyond `max_entries`. Calls raise sqlite3.Error when the
+    database stays locked past `busy_timeout_ms`.
+    """
+
+    def __init__(self, path=EXTRACTION_CACHE_PATH, max_entries=EXTRACTION_CACHE_MAX_ENTRIES, version=1,
+                 busy_timeout_ms=EXTRACTION_CACHE_BUSY_TIMEOUT_MS):
+        self.path = path
+        self.max_entries = max_entries
+        self.version = version
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=busy_timeout_ms / 1000, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+        # WAL lets several worker processes read while one writes.
+        self._db.execute("PRAGMA journal_mode=WAL")
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(extractions)")]
+        if columns and "extractor_version" not in columns:
+            # Rows from before extractions were versioned; it is only a cache
+            self._db.execute("DROP TABLE extractions")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS extractions (
+                url TEXT NOT NULL,
+                body_hash TEXT NOT NULL,
+                extractor_version INTEGER NOT NULL,
+                title TEXT NOT NULL,
+                content_html TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (url, body_hash, extractor_version)
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS extractions_last_used ON extractions (last_used)")
+
+    def get(self, url, body_hash):
+        """Return (title, content_html) for an unchanged page, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT title, content_html FROM extractions WHERE url = ? AND body_hash = ? AND extractor_version = ?",
+                (url, body_hash, self.version)).fetchone()
+            if row is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            try:
+                self._db.execute(
+                    "UPDATE extractions SET last_used = ? WHERE url = ? AND body_hash = ? AND extractor_version = ?",
+                    (time.time(), url, body_hash, self.version))
+            except sqlite3.OperationalError:
+                # Another process holds the write lock; the row is still good to use
+                pass
+            return row
+
+    def has_url(self, url):
+        """Whether this extractor version has a row for `url`, whatever body it came from."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM extractions WHERE url = ? AND extractor_version = ? LIMIT 1",
+                (url, self.version)).fetchone() is not None
+
+    def put(self, url, body_hash, title, content_html):
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                # An older body or extractor for the same URL can never be hit again.
+                self._db.execute(
+                    "DELETE FROM extractions WHERE url = ? AND NOT (body_hash = ? AND extractor_version = ?)",
+                    (url, body_hash, self.version))
+                self._db.execute(
+                    "INSERT OR REPLACE INTO extractions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (url, body_hash, self.version, title, content_html, now, now))
+                self._db.execute("""
+                    DELETE FROM extractions WHERE rowid IN (
+                        SELECT rowid FROM extractions ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_entries,))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": self._hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "max_entries": self.max_entries,
+            }
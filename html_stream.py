@@ -0,0 +1,81 @@
+import codecs
+import re
+
+from bs4 import BeautifulSoup
+from bs4.dammit import EncodingDetector
+from requests.compat import chardet
+
+
+# Bytes inspected for a BOM, <meta charset> or statistical guess before parsing starts.
+SNIFF_BYTES = 64 * 1024
+
+_CHARSET_RE = re.compile(r"""charset\s*=\s*["']?([\w.:-]+)""", re.I)
+
+
+def _normalize(encoding):
+    try:
+        return codecs.lookup(encoding).name if encoding else None
+    except LookupError:
+        return None
+
+
+def sniff_encoding(content_type, head):
+    """
+    Pick the page encoding from the first bytes of the body, without
+    decoding the whole page: byte order mark, then an explicit charset in
+    the Content-Type header, then a <meta> declaration, then a guess.
+    """
+    _, bom_encoding = EncodingDetector.strip_byte_order_mark(head)
+    if bom_encoding:
+        return _normalize(bom_encoding)
+    match = _CHARSET_RE.search(content_type or "")
+    encoding = _normalize(match.group(1)) if match else None
+    if encoding:
+        return encoding
+    encoding = _normalize(EncodingDetector.find_declared_encoding(head[:SNIFF_BYTES], is_html=True))
+    if encoding:
+        return encoding
+    return _normalize(chardet.detect(head[:SNIFF_BYTES])["encoding"]) or "utf-8"
+
+
+class IncrementalSoupParser:
+    """
+    Builds a BeautifulSoup tree with lxml from byte chunks as they are fed,
+    so the page is never held as one decoded string and no full-body
+    charset detection runs.
+    """
+
+    def __init__(self, encoding):
+        soup = BeautifulSoup("", "lxml")
+        # Reuse the soup's lxml builder, but drive its parser ourselves.
+        soup.reset()
+        soup.builder.initialize_soup(soup)
+        soup.builder.reset()
+        soup.original_encoding = encoding
+        self.soup = soup
+        self._parser = soup.builder.parser_for(encoding)
+        self._fed = False
+
+    def feed(self, chunk):
+        if chunk:
+            self._parser.feed(chunk)
+            self._fed = True
+
+    def close(self):
+        """Finish parsing and return the soup (empty if nothing was fed)."""
+        soup = self.soup
+        if self._fed:
+            self._parser.close()
+        soup.endData()
+        while soup.currentTag is not None and soup.currentTag.name != soup.ROOT_TAG_NAME:
+            soup.popTag()
+        soup.builder.soup = None
+        return soup
+
+
+def parse_chunks(chunks, encoding):
+    """Parse an iterable of byte chunks into a BeautifulSoup tree."""
+    parser = IncrementalSoupParser(encoding)
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
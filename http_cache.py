@@ -0,0 +1,309 @@
+import contextlib
+import email.utils
+import hashlib
+import json
+import os
+import re
+import struct
+import threading
+import time
+
+from requests.compat import chardet
+from requests.structures import CaseInsensitiveDict
+
+from disk_cache import DiskCache
+from html_stream import SNIFF_BYTES, IncrementalSoupParser, sniff_encoding
+from http_session import get_session
+
+
+# --- HTTP CACHE CONFIGURATION ---
+HTTP_CACHE_DIR = os.environ.get("HTTP_CACHE_DIR", os.path.join("cache", "http"))
+HTTP_CACHE_MAX_MB = int(os.environ.get("HTTP_CACHE_MAX_MB", "200"))
+# Pages larger than this (decoded) are rejected while streaming.
+MAX_PAGE_MB = int(os.environ.get("MAX_PAGE_MB", "10"))
+CHUNK_BYTES = 64 * 1024
+
+# Cache entries are the raw body, then its JSON metadata, then this footer:
+# the metadata length and a format tag. Written after the body, the
+# metadata can hold the body's hash and size once it has streamed in.
+_FOOTER = struct.Struct(">I4s")
+_FORMAT_TAG = b"HTC2"
+
+
+class PageTooLargeError(Exception):
+    """Raised when a page body exceeds the download size limit."""
+
+    def __init__(self, url, limit):
+        self.url = url
+        self.limit = limit
+        super().__init__(f"Page is larger than the {limit // (1024 * 1024)} MB download limit: {url}")
+
+
+class CachedPage:
+    """
+    The parts of a fetched page the extractors need, wherever it came from.
+    The body is read back in chunks from its cache entry (or memory, for a
+    page that may not be stored) rather than held as one string. `soup` is
+    the page parsed while it downloaded, when fetch() was asked to parse,
+    and `parse_seconds` the parser's share of the download time.
+    """
+
+    def __init__(self, url, status_code, headers, encoding, cache_status, body_hash, size,
+                 body=None, path=None, soup=None, parse_seconds=0.0):
+        self.url = url
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.encoding = encoding
+        # "fresh" (served from disk), "revalidated" (304) or "miss"
+        self.cache_status = cache_status
+        self.body_hash = body_hash
+        self.size = size
+        self.soup = soup
+        self.parse_seconds = parse_seconds
+        # The body in memory, or None to read it from the entry at `path`.
+        # The entry is only opened while it is read, so it can be replaced or evicted.
+        self._body = body
+        self._path = path
+
+    def iter_chunks(self, size=CHUNK_BYTES):
+        if self._body is not None:
+            for start in range(0, self.size, size):
+                yield bytes(self._body[start:start + size])
+            return
+        with open(self._path, "rb") as body:
+            remaining = self.size
+            while remaining:
+                chunk = body.read(min(size, remaining))
+                if not chunk:
+                    raise OSError(f"Cached body of {self.url} is truncated")
+                remaining -= len(chunk)
+                yield chunk
+
+    @property
+    def content(self):
+        return b"".join(self.iter_chunks())
+
+    @property
+    def text(self):
+        content = self.content
+        encoding = self.encoding
+        if encoding is None:
+            encoding = chardet.detect(content)["encoding"] or "utf-8"
+        return content.decode(encoding, errors="replace")
+
+
+def _parse_cache_control(value):
+    directives = {}
+    for part in (value or "").split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"')
+    return directives
+
+
+def _http_date(value):
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def _freshness_lifetime(headers, now):
+    """Seconds the response may be served without revalidation (RFC 9111, private cache)."""
+    cache_control = _parse_cache_control(headers.get("Cache-Control"))
+    if "no-cache" in cache_control:
+        return 0
+    if re.fullmatch(r"\d+", cache_control.get("max-age", "")):
+        lifetime = int(cache_control["max-age"])
+    else:
+        expires = _http_date(headers.get("Expires"))
+        date = _http_date(headers.get("Date")) or now
+        lifetime = max(0, int(expires - date)) if expires else 0
+    age = headers.get("Age", "")
+    return max(0, lifetime - int(age)) if age.isdigit() else lifetime
+
+
+def _copy(source, target, length):
+    """Copy `length` bytes from the current position of `source` to `target`."""
+    while length:
+        chunk = source.read(min(CHUNK_BYTES, length))
+        if not chunk:
+            raise OSError("Cached body is truncated")
+        target.write(chunk)
+        length -= len(chunk)
+
+
+class HttpCache:
+    """
+    Local HTTP cache for raw page fetches.
+
+    Bodies are stored on disk together with their validators (ETag,
+    Last-Modified) and freshness lifetime. Fresh entries are served straight
+    from disk; stale ones are revalidated with a conditional request and
+    served from disk on 304 Not Modified. Each entry is one file (body, JSON
+    metadata, footer), so eviction is all-or-nothing, and a downloaded body
+    is written into it chunk by chunk instead of being held in memory.
+    """
+
+    def __init__(self, directory=HTTP_CACHE_DIR, max_bytes=HTTP_CACHE_MAX_MB * 1024 * 1024):
+        self._store = DiskCache(directory, max_bytes, suffix=".http")
+        self._lock = threading.Lock()
+        self._stats = {"fresh": 0, "revalidated": 0, "miss": 0}
+
+    def fetch(self, url, headers=None, timeout=30, max_bytes=MAX_PAGE_MB * 1024 * 1024, parse=False):
+        """
+        GET `url`, using the cache where HTTP semantics allow. Raises on HTTP
+        errors, and PageTooLargeError once the body grows past `max_bytes`.
+        With `parse`, a downloaded body is also fed to the HTML parser as it
+        arrives, and the page comes back with its `soup`.
+        """
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        entry = self._load(key)
+        now = time.time()
+
+        if entry and now - entry["meta"]["stored_at"] < entry["meta"]["lifetime"]:
+            return self._served(entry, url, "fresh")
+
+        request_headers = dict(headers or {})
+        if entry:
+            if entry["meta"].get("etag"):
+                request_headers["If-None-Match"] = entry["meta"]["etag"]
+            if entry["meta"].get("last_modified"):
+                request_headers["If-Modified-Since"] = entry["meta"]["last_modified"]
+
+        with get_session().get(url, headers=request_headers, timeout=timeout, stream=True) as response:
+            if entry and response.status_code == 304:
+                # Not modified: keep the stored body, refresh validators and freshness.
+                merged = CaseInsensitiveDict(entry["meta"]["headers"])
+                merged.update(response.headers)
+                meta = self._meta(url, merged, entry["meta"]["encoding"], entry["meta"]["body_hash"],
+                                  entry["meta"]["size"], now)
+                try:
+                    # The old entry is closed before the new one replaces it
+                    with self._store.writer(key) as out, open(entry["path"], "rb") as body:
+                        _copy(body, out, entry["meta"]["size"])
+                        self._write_footer(out, meta)
+                except OSError as e:
+                    print(f"Could not cache {url}: {str(e)}")
+                return self._served(entry, url, "revalidated")
+
+            response.raise_for_status()
+            storable = (response.status_code == 200
+                        and "no-store" not in _parse_cache_control(response.headers.get("Cache-Control")))
+            page = self._download(response, url, max_bytes, key if storable else None, parse, now)
+
+        with self._lock:
+            self._stats["miss"] += 1
+        return page
+
+    def _download(self, response, url, max_bytes, key, parse, now):
+        """
+        Stream the body, enforcing the size cap and hashing as chunks arrive.
+        Each chunk goes straight into the cache entry under `key` (or into
+        memory when `key` is None) and, with `parse`, to the parser as soon
+        as the encoding is settled from the head of the page, so parsing
+        overlaps the download.
+        """
+        declared = response.headers.get("Content-Length", "")
+        if declared.isdigit() and int(declared) > max_bytes:
+            raise PageTooLargeError(url, max_bytes)
+        content_type = response.headers.get("Content-Type")
+        hasher = hashlib.sha256()
+        size = 0
+        head = bytearray()
+        encoding = None
+        parser = None
+        parse_seconds = 0.0
+        memory = bytearray() if key is None else None
+        with (self._store.writer(key) if key else contextlib.nullcontext()) as out:
+            for chunk in response.iter_content(CHUNK_BYTES):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise PageTooLargeError(url, max_bytes)
+                hasher.update(chunk)
+                if out is None:
+                    memory += chunk
+                else:
+                    out.write(chunk)
+                if encoding is None:
+                    head += chunk
+                    if len(head) < SNIFF_BYTES:
+                        continue
+                    # Settle the encoding from the head of the page, not the whole body.
+                    encoding = sniff_encoding(content_type, bytes(head[:SNIFF_BYTES]))
+                    chunk = bytes(head)
+                if parse:
+                    start = time.perf_counter()
+                    parser = parser or IncrementalSoupParser(encoding)
+                    parser.feed(chunk)
+                    parse_seconds += time.perf_counter() - start
+            if encoding is None:
+                encoding = sniff_encoding(content_type, bytes(head))
+            body_hash = hasher.hexdigest()
+            if out is not None:
+                self._write_footer(out, self._meta(url, response.headers, encoding, body_hash, size, now))
+
+        soup = None
+        if parse:
+            start = time.perf_counter()
+            parser = parser or IncrementalSoupParser(encoding)
+            if head and len(head) < SNIFF_BYTES:
+                parser.feed(bytes(head))
+            soup = parser.close()
+            parse_seconds += time.perf_counter() - start
+        return CachedPage(url, response.status_code, response.headers, encoding, "miss", body_hash, size,
+                          body=memory, path=self._store.path_for(key) if key else None, soup=soup,
+                          parse_seconds=parse_seconds)
+
+    def _served(self, entry, url, cache_status):
+        with self._lock:
+            self._stats[cache_status] += 1
+        meta = entry["meta"]
+        return CachedPage(url, 200, meta["headers"], meta["encoding"], cache_status, meta["body_hash"],
+                          meta["size"], path=entry["path"])
+
+    def _load(self, key):
+        """The entry under `key` as its metadata and its path, or None."""
+        path = self._store.get(key)
+        if not path:
+            return None
+        try:
+            with open(path, "rb") as f:
+                f.seek(-_FOOTER.size, os.SEEK_END)
+                meta_length, tag = _FOOTER.unpack(f.read(_FOOTER.size))
+                if tag != _FORMAT_TAG:
+                    raise ValueError("not an entry in the current format")
+                f.seek(-(_FOOTER.size + meta_length), os.SEEK_END)
+                meta = json.loads(f.read(meta_length))
+        except (OSError, ValueError, struct.error):
+            return None
+        return {"meta": meta, "path": path}
+
+    def _meta(self, url, headers, encoding, body_hash, size, now):
+        return {
+            "url": url,
+            "stored_at": now,
+            "lifetime": _freshness_lifetime(headers, now),
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "encoding": encoding,
+            "body_hash": body_hash,
+            "size": size,
+            "headers": {name: value for name, value in headers.items()
+                        if name.lower() in ("content-type", "cache-control", "expires", "date",
+                                            "etag", "last-modified")},
+        }
+
+    def _write_footer(self, out, meta):
+        data = json.dumps(meta).encode("utf-8")
+        out.write(data + _FOOTER.pack(len(data), _FORMAT_TAG))
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._stats)
+        lookups = sum(counts.values())
+        served = counts["fresh"] + counts["revalidated"]
+        store = self._store.stats()
+        return dict(counts, hit_ratio=served / lookups if lookups else 0.0,
+                    size_bytes=store["size_bytes"], max_bytes=store["max_bytes"])
+
@@ -0,0 +1,57 @@
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# --- HTTP POOL CONFIGURATION ---
+# Number of hosts to keep connection pools for, and keep-alive connections per host.
+POOL_CONNECTIONS = int(os.environ.get("HTTP_POOL_CONNECTIONS", "32"))
+POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "8"))
+
+
+class _KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter whose per-host pools are shared by every thread's session."""
+
+    def __init__(self):
+        super().__init__(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, pool_block=False)
+
+    def pool_stats(self):
+        """Return idle keep-alive connections per host pool."""
+        stats = {}
+        for key in list(self.poolmanager.pools.keys()):
+            pool = self.poolmanager.pools.get(key)
+            if pool is not None and pool.pool is not None:
+                # Unused slots in the pool queue are None placeholders.
+                idle = sum(1 for conn in list(pool.pool.queue) if conn is not None)
+                stats[f"{key.key_scheme}://{key.key_host}:{key.key_port}"] = idle
+        return stats
+
+
+# urllib3's PoolManager is thread-safe, so one adapter serves the whole process.
+_adapter = _KeepAliveAdapter()
+_local = threading.local()
+
+
+def get_session():
+    """
+    Return this thread's requests.Session.
+
+    Sessions are per thread so cookies and headers never leak between
+    requests running in parallel, but they all mount the same adapter, so
+    TCP and TLS connections to a host are kept alive and reused across
+    threads and conversions.
+    """
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.mount("https://", _adapter)
+        session.mount("http://", _adapter)
+        _local.session = session
+    return session
+
+
+def pool_stats():
+    """Idle keep-alive connections per host, for diagnostics."""
+    return _adapter.pool_stats()
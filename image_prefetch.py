@@ -0,0 +1,343 @@
+import hashlib
+import io
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from urllib.parse import urlparse, urlsplit, urlunsplit
+
+from requests.utils import requote_uri
+
+import metrics
+from disk_cache import DiskCache
+from http_session import get_session
+
+try:
+    from PIL import Image as PILImage, ImageOps
+except ImportError:
+    # Pillow is optional: without it images are served at their downloaded size
+    PILImage = None
+
+
+# --- IMAGE PREFETCH CONFIGURATION ---
+# Article images are downloaded here during extraction and served to the renderer from disk.
+ASSET_CACHE_DIR = os.environ.get("ASSET_CACHE_DIR", os.path.join("cache", "assets"))
+ASSET_CACHE_MAX_MB = int(os.environ.get("ASSET_CACHE_MAX_MB", "500"))
+# Downloads in flight across all articles, and per image host.
+PREFETCH_WORKERS = int(os.environ.get("IMAGE_PREFETCH_WORKERS", "16"))
+PREFETCH_PER_HOST = int(os.environ.get("IMAGE_PREFETCH_PER_HOST", "4"))
+PREFETCH_TIMEOUT_SECONDS = float(os.environ.get("IMAGE_PREFETCH_TIMEOUT_SECONDS", "15"))
+PREFETCH_MAX_MB = int(os.environ.get("IMAGE_PREFETCH_MAX_MB", "15"))
+# Longest an article waits for its images; the rest load from the network at render time.
+PREFETCH_DEADLINE_SECONDS = float(os.environ.get("IMAGE_PREFETCH_DEADLINE_SECONDS", "20"))
+
+# Images wider than they can print are resampled to this many pixels per
+# inch of printed width and recompressed (0 turns downscaling off). The
+# printed width is at most the A4 text width, 8.27in less 2cm margins.
+PRINT_DPI = int(os.environ.get("IMAGE_PRINT_DPI", "200"))
+PRINT_MAX_WIDTH_INCHES = float(os.environ.get("IMAGE_PRINT_MAX_WIDTH_INCHES", "6.7"))
+PRINT_JPEG_QUALITY = int(os.environ.get("IMAGE_PRINT_JPEG_QUALITY", "85"))
+
+PREFETCH_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'image/avif,image/webp,image/apng,image/*,*/*;q=0.8'
+}
+
+# Leading bytes of the image formats browsers render, for serving cached files
+_IMAGE_SIGNATURES = [
+    (b"\x89PNG", "image/png"),
+    (b"\xff\xd8", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+    (b"RIFF", "image/webp"),
+    (b"\x00\x00\x01\x00", "image/x-icon"),
+]
+
+# Formats worth resampling; GIFs are mostly animations or tiny palettes
+_RESAMPLE_FORMATS = {"JPEG", "PNG", "WEBP"}
+# EXIF orientations that swap an image's width and height
+_ROTATED_ORIENTATIONS = {5, 6, 7, 8}
+# How many (URL, width) pairs are remembered as needing no print copy
+_UNCOPIED_TRACKED = 50000
+
+
+def normalize_url(url):
+    """
+    An image URL the way Chromium puts it on the wire: lower-case scheme and
+    punycode host, no default port or fragment, path and query
+    percent-encoded. Asset cache keys use this form, so a `src` and the
+    request the renderer makes for it find the same entry.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = parts.hostname or ""
+    try:
+        host = host.encode("idna").decode("ascii")
+    except UnicodeError:
+        pass
+    if ":" in host:
+        host = f"[{host}]"
+    if parts.port and parts.port != {"http": 80, "https": 443}.get(scheme):
+        host = f"{host}:{parts.port}"
+    if parts.username is not None:
+        host = f"{parts.netloc.rsplit('@', 1)[0]}@{host}"
+    path = requote_uri(parts.path or "/")
+    query = requote_uri(parts.query) if parts.query else ""
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def image_content_type(path):
+    """Content type of a cached image file, from its first bytes."""
+    with open(path, "rb") as f:
+        head = f.read(512)
+    for signature, content_type in _IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head[4:12] in (b"ftypavif", b"ftypavis"):
+        return "image/avif"
+    if b"<svg" in head or head.lstrip().startswith(b"<?xml"):
+        return "image/svg+xml"
+    return "application/octet-stream"
+
+
+def print_width(width_attr=None, dpi=PRINT_DPI):
+    """
+    Most pixels an image can use across the printed page at `dpi`: the text
+    width, or less when the <img> width attribute makes it narrower. None
+    when downscaling is off.
+    """
+    if dpi <= 0:
+        return None
+    inches = PRINT_MAX_WIDTH_INCHES
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*(?:px)?\s*", width_attr or "")
+    if match and float(match.group(1)) > 0:
+        inches = min(inches, float(match.group(1)) / 96)
+    # Never below one image pixel per CSS pixel, or the layout would shrink
+    return math.ceil(inches * max(dpi, 96))
+
+
+class ImagePrefetcher:
+    """
+    Downloads article images concurrently into an on-disk asset cache, on a
+    bounded worker pool shared by every article. At most `per_host`
+    downloads per host are handed to the pool at a time; the rest wait in
+    a per-host queue, so a slow host never holds workers other hosts need. Renders then serve the images from disk
+    through `local_files` instead of fetching them from the network. With
+    Pillow installed, images wider than they can print are also stored as
+    a downscaled copy, cached by URL and width; `local_files` serves each
+    document the copies for the widths it uses.
+    """
+
+    def __init__(self, cache_dir=ASSET_CACHE_DIR, max_mb=ASSET_CACHE_MAX_MB, workers=PREFETCH_WORKERS,
+                 per_host=PREFETCH_PER_HOST, timeout=PREFETCH_TIMEOUT_SECONDS, max_bytes=PREFETCH_MAX_MB * 1024 * 1024,
+                 deadline=PREFETCH_DEADLINE_SECONDS):
+        self.cache = DiskCache(cache_dir, max_mb * 1024 * 1024)
+        self.per_host = max(1, per_host)
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.deadline = deadline
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="image-prefetch")
+        # Per host: tasks handed to the pool, and tasks waiting for one of them to finish
+        self._host_running = {}
+        self._host_waiting = {}
+        self._uncopied = {}
+        self._lock = threading.Lock()
+        if PILImage is None and PRINT_DPI > 0:
+            print("Pillow is not installed: article images will not be downscaled for print")
+
+    @staticmethod
+    def key(url, width=None):
+        """Cache key of an image URL, or of its copy resampled to `width` pixels."""
+        name = normalize_url(url) if width is None else f"{normalize_url(url)}#{width}w"
+        return hashlib.sha256(name.encode("utf-8")).hexdigest()
+
+    def local_file(self, url, width=None):
+        """
+        (path, content type) of the cached copy of an image URL, or None. With
+        `width`, its print copy at that width is preferred when there is one.
+        """
+        path = (width and self.cache.get(self.key(url, width))) or self.cache.get(self.key(url))
+        return (path, image_content_type(path)) if path else None
+
+    def local_files(self, max_widths):
+        """
+        A local_file lookup for the images of one document, serving those in
+        `max_widths` (URL to print width, as given to prefetch) at that width.
+        """
+        widths = {normalize_url(url): width for url, width in max_widths.items()}
+        return lambda url: self.local_file(url, widths.get(normalize_url(url)))
+
+    def _dispatch(self, host, task):
+        """Run `task` on the pool once `host` has fewer than `per_host` tasks there; returns its Future."""
+        future = Future()
+        with self._lock:
+            running = self._host_running.get(host, 0)
+            if running >= self.per_host:
+                self._host_waiting.setdefault(host, deque()).append((task, future))
+                return future
+            self._host_running[host] = running + 1
+        future.set_running_or_notify_cancel()
+        self._pool.submit(self._run, host, task, future)
+        return future
+
+    def _run(self, host, task, future):
+        try:
+            future.set_result(task())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            self._next(host)
+
+    def _next(self, host):
+        """Hand the host's next waiting task, skipping cancelled ones, to the pool in place of a finished one."""
+        with self._lock:
+            waiting = self._host_waiting.get(host)
+            while waiting:
+                task, future = waiting.popleft()
+                if future.set_running_or_notify_cancel():
+                    break
+            else:
+                self._host_waiting.pop(host, None)
+                self._host_running[host] -= 1
+                if not self._host_running[host]:
+                    del self._host_running[host]
+                return
+        self._pool.submit(self._run, host, task, future)
+
+    def prefetch(self, urls, referer=None, max_widths=None):
+        """
+        Make sure every http(s) URL in `urls` is in the asset cache, fetching
+        the missing ones concurrently. `max_widths` maps URLs to the most
+        pixels they can print at (see print_width); wider images get a
+        downscaled copy. Return how many were already cached, fetched,
+        failed, downscaled and still loading when the deadline passed; those
+        are left to the network.
+        """
+        max_widths = max_widths or {}
+        pending = []
+        counts = {"cached": 0, "fetched": 0, "failed": 0, "downscaled": 0, "late": 0}
+        for url in dict.fromkeys(urls):
+            if not url.startswith(("http://", "https://")):
+                continue
+            fetch = not os.path.exists(self.cache.path_for(self.key(url)))
+            max_width = max_widths.get(url) if PILImage is not None else None
+            if max_width:
+                with self._lock:
+                    uncopied = (normalize_url(url), max_width) in self._uncopied
+                if uncopied or os.path.exists(self.cache.path_for(self.key(url, max_width))):
+                    max_width = None
+            if not fetch:
+                counts["cached"] += 1
+            if fetch or max_width:
+                pending.append((url, fetch, max_width))
+        deadline = time.monotonic() + self.deadline
+        futures = [self._dispatch(urlparse(url).hostname,
+                                  lambda url=url, fetch=fetch, max_width=max_width:
+                                  self._prepare(url, referer, fetch, max_width, deadline))
+                   for url, fetch, max_width in pending]
+        done, late = wait(futures, timeout=self.deadline)
+        for future in late:
+            # Queued ones never start; running ones finish into the cache for next time
+            future.cancel()
+        counts["late"] = len(late)
+        for future in done:
+            fetched, downscaled = future.result()
+            if fetched is not None:
+                counts["fetched" if fetched else "failed"] += 1
+            counts["downscaled"] += downscaled
+        return counts
+
+    def _prepare(self, url, referer, fetch, max_width, deadline):
+        """Fetch an image if asked to, then make its print copy. Returns (fetched or None, downscaled)."""
+        if time.monotonic() > deadline:
+            return None, False
+        if fetch and not self._fetch(url, referer, deadline):
+            return False, False
+        return (True if fetch else None), bool(max_width) and self._downscale(url, max_width)
+
+    def _fetch(self, url, referer, deadline):
+        headers = dict(PREFETCH_HEADERS, Referer=referer) if referer else PREFETCH_HEADERS
+        try:
+            with metrics.span("image_fetch"):
+                with get_session().get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+                    response.raise_for_status()
+                    content_type = response.headers.get("Content-Type", "")
+                    if content_type and not content_type.startswith("image/"):
+                        raise ValueError(f"not an image ({content_type})")
+                    with self.cache.writer(self.key(url)) as f:
+                        size = 0
+                        for chunk in response.iter_content(64 * 1024):
+                            size += len(chunk)
+                            if size > self.max_bytes:
+                                raise ValueError(f"larger than {self.max_bytes // (1024 * 1024)} MB")
+                            # `timeout` bounds each read, not a server trickling bytes
+                            if time.monotonic() > deadline:
+                                raise TimeoutError("still downloading at the prefetch deadline")
+                            f.write(chunk)
+            return True
+        except Exception as e:
+            print(f"Could not prefetch image {url}: {str(e)}")
+            return False
+
+    def _downscale(self, url, max_width):
+        """
+        Store a copy of a cached image resampled to `max_width` pixels, which
+        local_file serves for that width. Returns whether it did: images that
+        already fit, animations and formats not worth resampling are served
+        as downloaded.
+        """
+        try:
+            path = self.cache.get(self.key(url))
+            if not path:
+                return False
+            with metrics.span("image_resample"):
+                data = resample_for_print(path, max_width)
+            if data is not None:
+                self.cache.put_bytes(self.key(url, max_width), data)
+                return True
+            with self._lock:
+                if len(self._uncopied) >= _UNCOPIED_TRACKED:
+                    del self._uncopied[next(iter(self._uncopied))]
+                self._uncopied[(normalize_url(url), max_width)] = True
+        except Exception as e:
+            print(f"Could not downscale image {url}: {str(e)}")
+        return False
+
+def resample_for_print(path, max_width):
+    """
+    The image at `path` resampled to `max_width` pixels wide and recompressed,
+    or None when it is no wider, animated, not a JPEG/PNG/WebP or would not
+    get smaller. Photos are written as JPEG and anything with transparency,
+    or drawn as a PNG, as PNG.
+    """
+    with PILImage.open(path) as image:
+        if image.format not in _RESAMPLE_FORMATS or getattr(image, "n_frames", 1) > 1:
+            return None
+        rotated = image.getexif().get(0x0112, 1) in _ROTATED_ORIENTATIONS
+        shown_width = image.height if rotated else image.width
+        if shown_width <= max_width:
+            return None
+        source_format = image.format
+        icc_profile = image.info.get("icc_profile")
+        if source_format == "JPEG":
+            # Let libjpeg decode at a reduced scale: far cheaper than a full-size decode
+            scale = max_width / shown_width
+            image.draft(image.mode, (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+        # Bake in the EXIF rotation, which the recompressed file no longer carries
+        image = ImageOps.exif_transpose(image)
+
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+    if image.mode not in ("RGB", "RGBA", "L"):
+        image = image.convert("RGBA" if has_alpha else "RGB")
+        icc_profile = None
+    height = max(1, round(image.height * max_width / image.width))
+    image = image.resize((max_width, height), PILImage.LANCZOS, reducing_gap=3.0)
+
+    out = io.BytesIO()
+    if source_format != "PNG" and not has_alpha:
+        image.save(out, "JPEG", quality=PRINT_JPEG_QUALITY, optimize=True, icc_profile=icc_profile)
+    else:
+        image.save(out, "PNG", optimize=True, icc_profile=icc_profile)
+    return out.getvalue() if out.tell() < os.path.getsize(path) else None
@@ -0,0 +1,164 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from admission import MAX_QUEUE_DEPTH, RENDER_TIMEOUT_SECONDS
+from browser_pool import POOL_SIZE
+
+
+# --- JOB QUEUE CONFIGURATION ---
+# One render worker per pooled browser by default, so queued jobs wait for a
+# warm browser instead of piling up inside Chromium.
+RENDER_WORKERS = int(os.environ.get("PDF_RENDER_WORKERS", str(POOL_SIZE)))
+JOB_TTL_SECONDS = int(os.environ.get("PDF_JOB_TTL_SECONDS", "3600"))
+# Job state lives in SQLite so any worker process can answer a /jobs/<id> poll.
+JOB_DB_PATH = os.environ.get("PDF_JOB_DB_PATH", os.path.join("cache", "jobs.sqlite3"))
+JOB_DB_BUSY_TIMEOUT_MS = int(os.environ.get("PDF_JOB_DB_BUSY_TIMEOUT_MS", "2000"))
+# The owning process renews a lease on its unfinished jobs; a job whose lease
+# lapses belonged to a worker that died or restarted, and is failed.
+JOB_HEARTBEAT_SECONDS = float(os.environ.get("PDF_JOB_HEARTBEAT_SECONDS", "5"))
+JOB_LEASE_SECONDS = float(os.environ.get("PDF_JOB_LEASE_SECONDS", "30"))
+# A job still unfinished after a full queue ahead of it plus its own render
+# (and screenshot fallback) has hung, and is failed too.
+JOB_MAX_AGE_SECONDS = float(os.environ.get(
+    "PDF_JOB_MAX_AGE_SECONDS", str((MAX_QUEUE_DEPTH // max(1, RENDER_WORKERS) + 2) * RENDER_TIMEOUT_SECONDS)))
+
+_COLUMNS = ("job_id", "status", "created_at", "started_at", "finished_at", "result", "error", "owner_pid", "heartbeat")
+
+
+class JobQueue:
+    """
+    Queue of render jobs backed by a bounded worker pool.
+
+    `submit()` returns a job ID immediately; the job runs on one of this
+    process's workers. Its status, result or error are kept in a SQLite file
+    shared by every worker process, so `get()` can read them back from any of
+    them. A job whose owning process stops renewing its lease, or that runs
+    past `max_age`, is reported as failed. Jobs are forgotten after `ttl` seconds.
+    """
+
+    def __init__(self, workers=RENDER_WORKERS, ttl=JOB_TTL_SECONDS, path=JOB_DB_PATH,
+                 busy_timeout_ms=JOB_DB_BUSY_TIMEOUT_MS, heartbeat=JOB_HEARTBEAT_SECONDS,
+                 lease=JOB_LEASE_SECONDS, max_age=JOB_MAX_AGE_SECONDS):
+        self.workers = max(1, workers)
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        self.lease = lease
+        self.max_age = max_age
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="render-job")
+        self._lock = threading.Lock()
+        # Jobs this process still has to settle; only these get their lease renewed.
+        self._owned = set()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=busy_timeout_ms / 1000, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+        self._db.execute("PRAGMA journal_mode=WAL")
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(jobs)")]
+        if columns and "heartbeat" not in columns:
+            # Rows from before jobs had owners can never be settled
+            self._db.execute("DROP TABLE jobs")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                result TEXT,
+                error TEXT,
+                owner_pid INTEGER NOT NULL,
+                heartbeat REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at)")
+        threading.Thread(target=self._renew_leases, name="render-job-lease", daemon=True).start()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue `fn(*args, **kwargs)` and return the new job's ID."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM jobs WHERE finished_at < ? OR (finished_at IS NULL AND created_at < ?)",
+                (now - self.ttl, now - self.ttl))
+            self._expire(now)
+            self._db.execute(
+                "INSERT INTO jobs (job_id, status, created_at, owner_pid, heartbeat) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, now, os.getpid(), now))
+            self._owned.add(job_id)
+        self._executor.submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def _run(self, job_id, fn, args, kwargs):
+        self._update(job_id, status="running", started_at=time.time())
+        try:
+            result = fn(*args, **kwargs)
+            self._update(job_id, status="done", result=json.dumps(result), finished_at=time.time())
+        except Exception as e:
+            print(f"Job {job_id} failed: {str(e)}")
+            self._update(job_id, status="failed", error=str(e), finished_at=time.time())
+        finally:
+            with self._lock:
+                self._owned.discard(job_id)
+
+    def _update(self, job_id, **fields):
+        # A job already failed as expired keeps that outcome.
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        try:
+            with self._lock:
+                self._db.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ? AND finished_at IS NULL",
+                                 (*fields.values(), job_id))
+        except sqlite3.Error as e:
+            print(f"Job {job_id}: could not record status {fields['status']}: {str(e)}")
+
+    def _renew_leases(self):
+        while True:
+            time.sleep(self.heartbeat)
+            try:
+                with self._lock:
+                    if self._owned:
+                        owned = list(self._owned)
+                        self._db.execute(
+                            f"UPDATE jobs SET heartbeat = ? WHERE job_id IN ({', '.join('?' * len(owned))})",
+                            (time.time(), *owned))
+            except sqlite3.Error as e:
+                print(f"Could not renew render job leases: {str(e)}")
+
+    def _expire(self, now):
+        """Fail unfinished jobs whose owner is gone or that ran too long. Call with the lock held."""
+        try:
+            self._db.execute("""
+                UPDATE jobs SET status = 'failed', finished_at = ?,
+                    error = CASE WHEN heartbeat < ? THEN 'The worker running this job stopped'
+                                 ELSE 'The job did not finish in time' END
+                WHERE finished_at IS NULL AND (heartbeat < ? OR created_at < ?)
+            """, (now, now - self.lease, now - self.lease, now - self.max_age))
+        except sqlite3.OperationalError:
+            # Another process holds the write lock; the next call tries again
+            pass
+
+    def get(self, job_id):
+        """Return a snapshot of the job, or None if it is unknown or expired."""
+        with self._lock:
+            self._expire(time.time())
+            row = self._db.execute(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(_COLUMNS, row))
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def stats(self):
+        """Return the number of jobs in each status, across all worker processes."""
+        counts = {"queued": 0, "running": 0, "done": 0, "failed": 0}
+        with self._lock:
+            self._expire(time.time())
+            for status, count in self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+                counts[status] = count
+        return dict(counts, workers=self.workers)
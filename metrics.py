@@ -0,0 +1,175 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+
+# --- METRICS CONFIGURATION ---
+# Upper bounds (seconds) of the stage duration histogram buckets.
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """A labelled Prometheus histogram with fixed buckets."""
+
+    def __init__(self, name, help, labelnames=(), buckets=STAGE_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._series = {}
+
+    def observe(self, value, *labelvalues):
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labelvalues, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                le = _labels(self.labelnames, labelvalues, [("le", _number(bound))])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labelvalues)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {values[-1]!r}")
+        return lines
+
+
+class Gauge:
+    """
+    A value read from a callback at scrape time: a number, or {label value: number}
+    when `labelname` is set. `kind` may be "counter" for monotonically growing values.
+    """
+
+    def __init__(self, name, help, callback, labelname=None, kind="gauge"):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.labelname = labelname
+        self.kind = kind
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        value = self.callback()
+        if self.labelname is None:
+            lines.append(f"{self.name} {_number(value)}")
+        else:
+            for labelvalue, number in sorted(value.items()):
+                lines.append(f"{self.name}{_labels((self.labelname,), (labelvalue,))} {_number(number)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help, labelname=None, kind="gauge"):
+        """Decorator registering a scrape-time gauge callback."""
+        def decorator(callback):
+            self.register(Gauge(name, help, callback, labelname, kind))
+            return callback
+        return decorator
+
+    def expose(self):
+        """Render every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.expose())
+            except Exception as e:
+                print(f"Could not collect metric {metric.name}: {str(e)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+stage_seconds = registry.register(Histogram(
+    "pdf_stage_duration_seconds", "Time spent in each pipeline stage.", ["stage"]))
+
+# Stage timings of the request or job being handled, for Server-Timing headers.
+_timings = contextvars.ContextVar("stage_timings", default=None)
+
+
+@contextmanager
+def span(stage):
+    """
+    Time a pipeline stage: observed in the stage histogram, and added to
+    the current request's timings when one is being collected.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+async def timed(stage, awaitable):
+    """Await `awaitable` inside span(stage), to time a single call."""
+    with span(stage):
+        return await awaitable
+
+
+def record(stage, seconds):
+    """Record an already measured stage duration."""
+    stage_seconds.observe(seconds, stage)
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def collect_timings():
+    """Collect the spans finished inside this block as a list of (stage, seconds)."""
+    timings = []
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def summarize_timings(timings):
+    """Total milliseconds per stage, in first-seen order."""
+    totals = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds * 1000
+    return {stage: round(ms, 1) for stage, ms in totals.items()}
+
+
+def server_timing_header(totals):
+    """Format {stage: milliseconds} as a Server-Timing header value."""
+    return ", ".join(f"{stage.replace(' ', '-')};dur={ms}" for stage, ms in totals.items())
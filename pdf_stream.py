@@ -0,0 +1,211 @@
+import asyncio
+import base64
+import os
+import queue
+import re
+import tempfile
+import threading
+
+
+# --- PDF STREAMING CONFIGURATION ---
+# Bytes requested from Chromium per IO.read call while streaming a printed PDF.
+PDF_STREAM_CHUNK_BYTES = int(os.environ.get("PDF_STREAM_CHUNK_BYTES", str(1024 * 1024)))
+# Chunks buffered between a streaming render and its reader before the render waits.
+PDF_STREAM_QUEUE_CHUNKS = int(os.environ.get("PDF_STREAM_QUEUE_CHUNKS", "8"))
+
+# Paper sizes in inches, as page.pdf(format=...) understands them.
+PAPER_FORMATS = {
+    "letter": (8.5, 11), "legal": (8.5, 14), "tabloid": (11, 17), "ledger": (17, 11),
+    "a0": (33.1, 46.8), "a1": (23.4, 33.1), "a2": (16.54, 23.4), "a3": (11.7, 16.54),
+    "a4": (8.27, 11.7), "a5": (5.83, 8.27), "a6": (4.13, 5.83),
+}
+
+_UNITS_PER_INCH = {"px": 96, "in": 1, "cm": 2.54, "mm": 25.4}
+
+
+def to_inches(value):
+    """Convert a page.pdf() length ("8.5in", "2cm", "960px" or a number of px) to inches."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return value / 96
+    match = re.fullmatch(r"\s*([0-9.]+)\s*(px|in|cm|mm)?\s*", str(value).lower())
+    if not match:
+        raise ValueError(f"Unsupported PDF length: {value!r}")
+    return float(match.group(1)) / _UNITS_PER_INCH[match.group(2) or "px"]
+
+
+def print_params(width=None, height=None, format=None, margin=None, print_background=False,
+                 prefer_css_page_size=False, display_header_footer=False, page_ranges="",
+                 scale=1.0, landscape=False):
+    """Translate page.pdf() keyword options into Page.printToPDF parameters."""
+    if format:
+        paper_width, paper_height = PAPER_FORMATS[format.lower()]
+    else:
+        paper_width, paper_height = to_inches(width) or 8.5, to_inches(height) or 11
+    margin = margin or {}
+    return {
+        "paperWidth": paper_width,
+        "paperHeight": paper_height,
+        "marginTop": to_inches(margin.get("top")) or 0,
+        "marginRight": to_inches(margin.get("right")) or 0,
+        "marginBottom": to_inches(margin.get("bottom")) or 0,
+        "marginLeft": to_inches(margin.get("left")) or 0,
+        "printBackground": print_background,
+        "preferCSSPageSize": prefer_css_page_size,
+        "displayHeaderFooter": display_header_footer,
+        "pageRanges": page_ranges or "",
+        "scale": scale,
+        "landscape": landscape,
+    }
+
+
+async def stream_pdf(page, write, **pdf_options):
+    """
+    Print `page` to PDF and hand the document to `write` chunk by chunk.
+
+    Uses Page.printToPDF with transferMode ReturnAsStream, then IO.read, so
+    only one chunk is ever held in Python however large the PDF is.
+    `write` receives bytes and may be a plain function or a coroutine
+    function. Takes the same keyword options as page.pdf() (without path)
+    and returns the number of bytes written.
+    """
+    try:
+        session = await page.context.new_cdp_session(page)
+    except Exception as e:
+        # No CDP (not Chromium): print in one piece instead
+        print(f"PDF streaming unavailable, printing in one piece: {str(e)}")
+        data = await page.pdf(**pdf_options)
+        result = write(data)
+        if asyncio.iscoroutine(result):
+            await result
+        return len(data)
+    try:
+        params = dict(print_params(**pdf_options), transferMode="ReturnAsStream")
+        handle = (await session.send("Page.printToPDF", params))["stream"]
+        total = 0
+        try:
+            while True:
+                chunk = await session.send("IO.read", {"handle": handle, "size": PDF_STREAM_CHUNK_BYTES})
+                data = base64.b64decode(chunk["data"]) if chunk.get("base64Encoded") else chunk["data"].encode("latin-1")
+                if data:
+                    total += len(data)
+                    result = write(data)
+                    if asyncio.iscoroutine(result):
+                        await result
+                if chunk.get("eof"):
+                    return total
+        finally:
+            await session.send("IO.close", {"handle": handle})
+    finally:
+        await session.detach()
+
+
+class PdfTarget:
+    """
+    Where a render sends its PDF: None keeps the bytes in memory, a file
+    path is written through a temporary file that only replaces the path
+    once the PDF is complete, and a callable receives each chunk (it may be
+    a coroutine function).
+    """
+
+    def __init__(self, target):
+        self.target = target
+        self.size = 0
+        self._chunks = []
+        self._file = None
+        self._tmp_path = None
+
+    def __enter__(self):
+        if self.target is not None and not callable(self.target):
+            fd, self._tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.target)),
+                                                  prefix=".tmp-", suffix=".pdf")
+            self._file = os.fdopen(fd, "wb")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._file is not None:
+            self._file.close()
+            if exc_type is None:
+                os.replace(self._tmp_path, self.target)
+            else:
+                os.remove(self._tmp_path)
+
+    async def write(self, chunk):
+        self.size += len(chunk)
+        if self.target is None:
+            self._chunks.append(chunk)
+        elif self._file is not None:
+            self._file.write(chunk)
+        else:
+            result = self.target(chunk)
+            if asyncio.iscoroutine(result):
+                await result
+
+    def result(self):
+        """The PDF bytes for an in-memory target, otherwise the number of bytes written."""
+        return b"".join(self._chunks) if self.target is None else self.size
+
+
+async def print_pdf(page, target, **pdf_options):
+    """
+    Print `page` with page.pdf() keyword options to a PdfTarget. With
+    `target` None the PDF bytes are returned; a file path or a chunk
+    callback gets the PDF streamed out of Chromium instead, and the number
+    of bytes written is returned.
+    """
+    if target is None:
+        return await page.pdf(**pdf_options)
+    with PdfTarget(target) as output:
+        await stream_pdf(page, output.write, **pdf_options)
+    return output.result()
+
+
+_END = object()
+
+
+class ChunkPipe:
+    """
+    Carries PDF chunks from a render on the browser loop to a synchronous
+    reader, such as a streamed HTTP response. The buffer is bounded, so a
+    slow client holds the render back instead of chunks piling up in memory.
+    Once the reader goes away, further writes raise ConnectionAbortedError.
+    """
+
+    def __init__(self, max_chunks=PDF_STREAM_QUEUE_CHUNKS):
+        self._queue = queue.Queue(max(1, max_chunks))
+        self._reader_gone = threading.Event()
+        self.bytes_written = 0
+
+    def _put(self, item):
+        while not self._reader_gone.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        raise ConnectionAbortedError("PDF stream reader went away")
+
+    async def write(self, chunk):
+        """Chunk callback for stream_pdf(); waits while the buffer is full."""
+        await asyncio.get_running_loop().run_in_executor(None, self._put, chunk)
+        self.bytes_written += len(chunk)
+
+    def close(self, error=None):
+        """End the stream, raising `error` in the reader if one is given."""
+        try:
+            self._put(error if error is not None else _END)
+        except ConnectionAbortedError:
+            pass
+
+    def __iter__(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _END:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            self._reader_gone.set()
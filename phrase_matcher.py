@@ -0,0 +1,132 @@
+from collections import deque
+
+from bs4 import NavigableString, Tag
+
+
+def load_phrases(path, default):
+    """
+    Read one phrase per line from `path`, skipping blank lines and # comments.
+    Returns `default` when no path is configured.
+    """
+    if not path:
+        return list(default)
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+class PhraseMatcher:
+    """
+    Aho-Corasick automaton over a fixed set of lowercase phrases.
+
+    The automaton is built once, so scanning a text costs one pass over its
+    characters however many phrases are configured, instead of one substring
+    search per phrase.
+    """
+
+    def __init__(self, phrases):
+        self.phrases = sorted({phrase.lower() for phrase in phrases if phrase})
+        self._goto = [{}]
+        self._fail = [0]
+        # Length of the shortest phrase ending at each state, 0 if none does.
+        self._shortest = [0]
+        for phrase in self.phrases:
+            self._add(phrase)
+        self._link()
+
+    def _add(self, phrase):
+        state = 0
+        for char in phrase:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._shortest.append(0)
+            state = next_state
+        if not self._shortest[state] or len(phrase) < self._shortest[state]:
+            self._shortest[state] = len(phrase)
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                inherited = self._shortest[self._fail[child]]
+                if inherited and (not self._shortest[child] or inherited < self._shortest[child]):
+                    self._shortest[child] = inherited
+
+    def _matches(self, text):
+        """Yield (end, length) for the shortest phrase ending at each matching position."""
+        goto, fail, shortest = self._goto, self._fail, self._shortest
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if shortest[state]:
+                yield index + 1, shortest[state]
+
+    def search(self, text):
+        """True if any phrase occurs in `text` (which must already be lowercase)."""
+        for _ in self._matches(text):
+            return True
+        return False
+
+    def latest_starts(self, text):
+        """
+        For every offset `end` in `text`, the start of the latest-starting
+        phrase that ends at or before `end`, or -1. A phrase lies entirely
+        inside text[start:end] exactly when latest_starts(text)[end] >= start.
+        """
+        latest = [-1] * (len(text) + 1)
+        for end, length in self._matches(text):
+            latest[end] = end - length
+        for end in range(1, len(latest)):
+            if latest[end] < latest[end - 1]:
+                latest[end] = latest[end - 1]
+        return latest
+
+
+class TextStream:
+    """
+    The lowercased get_text(strip=True) of a tree as one string, with the
+    span every element's own get_text(strip=True).lower() occupies in it.
+
+    Scanning the stream once and checking spans against the result replaces
+    scanning every nested element's text separately.
+    """
+
+    def __init__(self, root):
+        parts = []
+        starts = {}
+        self._spans = {}
+        offset = 0
+        # Iterative walk; deeply nested pages would overflow recursion.
+        stack = [("open", root)]
+        while stack:
+            kind, node = stack.pop()
+            if kind == "text":
+                # get_text() skips comments, doctypes and script/style text.
+                text = node.strip().lower()
+                parts.append(text)
+                offset += len(text)
+            elif kind == "open":
+                starts[id(node)] = offset
+                stack.append(("close", node))
+                for child in reversed(node.contents):
+                    if isinstance(child, Tag):
+                        stack.append(("open", child))
+                    elif type(child) is NavigableString:
+                        stack.append(("text", child))
+            else:
+                self._spans[id(node)] = (starts[id(node)], offset)
+        self.text = "".join(parts)
+
+    def span(self, tag):
+        return self._spans[id(tag)]
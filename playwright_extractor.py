@@ -1,92 +1,168 @@
-from playwright.sync_api import sync_playwright
+from playwright.async_api import async_playwright
 from bs4 import BeautifulSoup
-import re
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import os
 import json
+import sys
+import time
 from urllib.parse import urljoin, urlparse
 
+from boilerplate import BoilerplateClassifier
+from request_filter import RequestFilter
+
+
+# Title headings, in priority order
+H1_SELECTORS = ['h1', 'h1.title', '.title h1', '.entry-title', '.post-title']
+
+# Everything title and structured-data extraction need, in one round-trip:
+# the document title, the text of the first match of each heading selector
+# (null when absent or invalid) and the text of every JSON-LD script.
+PAGE_DATA_JS = """(headingSelectors) => ({
+    title: document.title,
+    headings: headingSelectors.map(selector => {
+        try {
+            const element = document.querySelector(selector);
+            return element ? element.innerText : null;
+        } catch (e) {
+            return null;
+        }
+    }),
+    json_ld: Array.from(document.querySelectorAll('script[type="application/ld+json"]'), script => script.innerText)
+})"""
+
+# Common content selectors, in priority order
+CONTENT_SELECTORS = [
+    'article',
+    'main article',
+    '[role="main"]',
+    'main',
+    '.entry-content',
+    '.post-content', 
+    '.article-content',
+    '.content-body',
+    '.article-body',
+    '.post-body',
+    '.story-content',
+    '.recipe-content',
+    '#content article',
+    '.content article'
+]
+
+# Finds and scores content candidates inside the page, so a whole document costs
+# one evaluate() instead of several CDP calls per element. Selector candidates
+# score text length + 50 per paragraph matched by "<selector> p" (+1000 when the
+# selector names article) and need 200+ characters; the first strictly best one
+# wins. Failing that, the first div/section/article/main with 500+ characters
+# and 3+ paragraphs is used. Returns the winner's HTML and score breakdown, or null.
+SCORE_CANDIDATES_JS = """(selectors) => {
+    // Python's len() counts code points, not UTF-16 units
+    const length = (text) => text.length - (text.match(/[\\uD800-\\uDBFF][\\uDC00-\\uDFFF]/g) || []).length;
+
+    let best = null;
+    for (const selector of selectors) {
+        let elements, paragraphs;
+        try {
+            elements = document.querySelectorAll(selector);
+            paragraphs = document.querySelectorAll(`${selector} p`).length;
+        } catch (e) {
+            continue;
+        }
+        const bonus = selector.includes('article') ? 1000 : 0;
+        for (const element of elements) {
+            const textLength = length(element.innerText || '');
+            if (textLength < 200) continue;
+            const score = textLength + paragraphs * 50 + bonus;
+            if (!best || score > best.score) {
+                best = {element, selector, score, text_length: textLength, paragraphs, article_bonus: bonus};
+            }
+        }
+    }
+
+    if (!best) {
+        for (const container of document.querySelectorAll('div, section, article, main')) {
+            const paragraphs = container.querySelectorAll('p').length;
+            if (paragraphs < 3) continue;
+            const textLength = length(container.innerText || '');
+            if (textLength >= 500) {
+                best = {element: container, selector: null, score: textLength, text_length: textLength,
+                        paragraphs, article_bonus: 0, strategy: 'fallback'};
+                break;
+            }
+        }
+    }
+
+    if (!best) return null;
+    const {element, ...breakdown} = best;
+    return {strategy: 'selector', ...breakdown, html: element.innerHTML};
+}"""
+
 
 def extract_clean_article_content(url, output_path=None):
     """
     Generic article extractor using Playwright
     Extracts only: title, main content, and images
     """
+    print(f"Loading: {url}")
     
-    with sync_playwright() as p:
-        # Launch browser
-        browser = p.chromium.launch(
-            headless=True,
-            args=['--disable-blink-features=AutomationControlled']
-        )
-        
-        try:
-            page = browser.new_page()
-            
-            # Set realistic headers
-            page.set_extra_http_headers({
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8'
-            })
-            
-            print(f"Loading: {url}")
-            
-            # Navigate and wait for content
-            page.goto(url, wait_until='networkidle', timeout=30000)
-            page.wait_for_load_state('domcontentloaded')
-            
-            # Wait a bit more for dynamic content
-            page.wait_for_timeout(2000)
-            
-            # Extract title
-            title = extract_title(page)
-            print(f"Title: {title}")
-            
-            # Extract main content
-            main_content = extract_main_content(page, url)
-            
-            if not main_content:
-                print("No main content found")
-                return None
-                
-            # Create clean HTML
-            clean_html = create_clean_html(title, main_content)
-            
-            # Save if output path provided
-            if output_path:
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    f.write(clean_html)
-                print(f"Saved to: {output_path}")
-            
-            return clean_html
-            
-        finally:
-            browser.close()
+    # One URL is a batch of one: same browser launch, headers and page loading
+    async def run():
+        return [result async for result in extract_articles_batch([url], 1)][0]
+    
+    result = asyncio.run(run())
+    counts = result["requests"]
+    if counts:
+        print(f"Blocked {counts['blocked']} of {counts['blocked'] + counts['allowed']} requests")
+    if result["title"]:
+        print(f"Title: {result['title']}")
+    
+    if not result["success"]:
+        print(result["error"])
+        return None
+    
+    clean_html = result["html"]
+    
+    # Save if output path provided
+    if output_path:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(clean_html)
+        print(f"Saved to: {output_path}")
+    
+    return clean_html
+
+
+async def extract_title_and_content_async(page, original_url):
+    """Return (title, cleaned content HTML or None) for a loaded page"""
+    data = await page.evaluate(PAGE_DATA_JS, H1_SELECTORS)
+    content = structured_content_from_page_data(data)
+    if not content:
+        content = content_from_candidate(await page.evaluate(SCORE_CANDIDATES_JS, CONTENT_SELECTORS), original_url)
+    return title_from_page_data(data), content
 
 
 def extract_title(page):
     """Extract page title using multiple strategies"""
+    return title_from_page_data(page.evaluate(PAGE_DATA_JS, H1_SELECTORS))
+
+
+def title_from_page_data(data):
+    """Pick the title from what PAGE_DATA_JS collected"""
     
     # Strategy 1: Standard title tag
-    title = page.title()
+    title = data['title']
     if title and title.strip() and title.lower() not in ['', 'untitled', 'document']:
         return title.strip()
     
     # Strategy 2: Main heading
-    h1_selectors = ['h1', 'h1.title', '.title h1', '.entry-title', '.post-title']
-    for selector in h1_selectors:
-        try:
-            element = page.query_selector(selector)
-            if element:
-                text = element.inner_text().strip()
-                if text:
-                    return text
-        except:
-            continue
+    for text in data['headings']:
+        if text and text.strip():
+            return text.strip()
     
     # Strategy 3: JSON-LD structured data
     try:
-        json_scripts = page.query_selector_all('script[type="application/ld+json"]')
-        for script in json_scripts:
-            content = script.inner_text()
+        for content in data['json_ld']:
             data = json.loads(content)
             if isinstance(data, list):
                 data = data[0]  # Take first item
@@ -104,88 +180,40 @@ def extract_main_content(page, original_url):
     """Extract main article content using multiple strategies"""
     
     # Strategy 1: Try JSON-LD structured data first (best for recipes/articles)
-    structured_content = extract_structured_content(page)
+    structured_content = structured_content_from_page_data(page.evaluate(PAGE_DATA_JS, H1_SELECTORS))
     if structured_content:
         return structured_content
     
-    # Strategy 2: Common content selectors
-    content_selectors = [
-        'article',
-        'main article',
-        '[role="main"]',
-        'main',
-        '.entry-content',
-        '.post-content', 
-        '.article-content',
-        '.content-body',
-        '.article-body',
-        '.post-body',
-        '.story-content',
-        '.recipe-content',
-        '#content article',
-        '.content article'
-    ]
-    
-    best_candidate = None
-    best_score = 0
-    
-    for selector in content_selectors:
-        try:
-            elements = page.query_selector_all(selector)
-            for element in elements:
-                if not element:
-                    continue
-                
-                # Score based on content quality
-                text_content = element.inner_text()
-                paragraphs = len(page.query_selector_all(f'{selector} p'))
-                
-                if len(text_content) < 200:  # Too short
-                    continue
-                
-                # Calculate score
-                score = len(text_content) + (paragraphs * 50)
-                
-                # Bonus for article tags
-                if 'article' in selector:
-                    score += 1000
-                
-                if score > best_score:
-                    best_score = score
-                    best_candidate = element
-                    
-        except:
-            continue
-    
-    if best_candidate:
-        html_content = best_candidate.inner_html()
-        return clean_extracted_content(html_content, original_url)
-    
-    # Strategy 3: Fallback - find container with most meaningful content
-    print("Using fallback content extraction...")
-    containers = page.query_selector_all('div, section, article, main')
+    # Strategies 2 and 3: score every candidate inside the page in one round-trip
+    result = page.evaluate(SCORE_CANDIDATES_JS, CONTENT_SELECTORS)
+    return content_from_candidate(result, original_url)
+
+
+def content_from_candidate(result, original_url):
+    """Clean the winning candidate returned by SCORE_CANDIDATES_JS, or return None."""
+    if not result:
+        return None
     
-    for container in containers:
-        try:
-            text = container.inner_text()
-            paragraphs = len(page.query_selector_all('p', container))
-            
-            if len(text) >= 500 and paragraphs >= 3:
-                html_content = container.inner_html()
-                return clean_extracted_content(html_content, original_url)
-        except:
-            continue
+    if result['strategy'] == 'fallback':
+        print("Using fallback content extraction...")
+        print(f"Fallback container: {result['text_length']} chars, {result['paragraphs']} paragraphs")
+    else:
+        bonus = f" + {result['article_bonus']} article bonus" if result['article_bonus'] else ""
+        print(f"Best candidate '{result['selector']}': score {result['score']} "
+              f"({result['text_length']} chars + {result['paragraphs']} paragraphs x 50{bonus})")
     
-    return None
+    return clean_extracted_content(result['html'], original_url)
 
 
 def extract_structured_content(page):
     """Extract content from JSON-LD structured data"""
+    return structured_content_from_page_data(page.evaluate(PAGE_DATA_JS, H1_SELECTORS))
+
+
+def structured_content_from_page_data(data):
+    """Format the first article/recipe JSON-LD block PAGE_DATA_JS collected, or return None"""
     try:
-        json_scripts = page.query_selector_all('script[type="application/ld+json"]')
-        
-        for script in json_scripts:
-            content = script.inner_text()
+        for content in data['json_ld']:
             data = json.loads(content)
             
             # Handle arrays
@@ -462,6 +490,24 @@ def aggressive_empty_list_cleanup(soup):
     print("="*60)
 
 
+# Remove unwanted elements
+ARTICLE_BOILERPLATE_TAGS = [
+    'script', 'style', 'noscript', 'iframe', 'embed', 'object',
+    'form', 'input', 'button', 'select', 'textarea'
+]
+
+# Remove elements by class/id patterns
+ARTICLE_BOILERPLATE_PATTERNS = [
+    r'\bads?\b', r'\bpromo\b', r'\bpopup\b', r'\bmodal\b',
+    r'\bshare\b', r'\bsocial\b', r'\bcomment\b', r'\bfooter\b',
+    r'\bheader\b', r'\bnav\b', r'\bmenu\b', r'\bsidebar\b',
+    r'\bnewsletter\b', r'\bsubscribe\b', r'\brelated\b',
+    r'\bauthor-bio\b', r'\bbreadcrumb\b'
+]
+
+article_boilerplate = BoilerplateClassifier(ARTICLE_BOILERPLATE_TAGS, ARTICLE_BOILERPLATE_PATTERNS)
+
+
 def clean_extracted_content(html_content, original_url):
     """Clean and process extracted HTML content with enhanced empty list removal."""
     from bs4 import BeautifulSoup
@@ -470,28 +516,8 @@ def clean_extracted_content(html_content, original_url):
 
     soup = BeautifulSoup(html_content, 'html.parser')
 
-    # Remove unwanted elements
-    unwanted_elements = [
-        'script', 'style', 'noscript', 'iframe', 'embed', 'object',
-        'form', 'input', 'button', 'select', 'textarea'
-    ]
-    for tag_name in unwanted_elements:
-        for element in soup.find_all(tag_name):
-            element.decompose()
-
-    # Remove elements by class/id patterns
-    removal_patterns = [
-        r'\bads?\b', r'\bpromo\b', r'\bpopup\b', r'\bmodal\b',
-        r'\bshare\b', r'\bsocial\b', r'\bcomment\b', r'\bfooter\b',
-        r'\bheader\b', r'\bnav\b', r'\bmenu\b', r'\bsidebar\b',
-        r'\bnewsletter\b', r'\bsubscribe\b', r'\brelated\b',
-        r'\bauthor-bio\b', r'\bbreadcrumb\b'
-    ]
-    for pattern in removal_patterns:
-        for element in soup.find_all(class_=re.compile(pattern, re.I)):
-            element.decompose()
-        for element in soup.find_all(id=re.compile(pattern, re.I)):
-            element.decompose()
+    # Remove unwanted elements and class/id patterns in a single tree walk
+    article_boilerplate.strip(soup)
 
     # Normalize whitespace globally
     def normalize_whitespace():
@@ -711,12 +737,146 @@ def create_clean_html(title, content):
 </html>"""
 
 
-# Usage example
-if __name__ == "__main__":
-    url = "https://www.thespruceeats.com/classic-tomato-pasta-sauce-recipe-3992836"
-    result = extract_clean_article_content(url, "clean_article_improved.html")
+# Pages extracted at once by the batch extractor, each in its own browser context
+BATCH_CONCURRENCY = int(os.environ.get("EXTRACT_BATCH_CONCURRENCY", "4"))
+
+
+def batch_output_path(output_dir, url):
+    """Stable file name for a URL's extracted article: <domain>_<url hash>.html"""
+    domain = urlparse(url).netloc.replace("www.", "") or "page"
+    digest = hashlib.sha1(url.encode("utf-8")).hexdigest()[:10]
+    return os.path.join(output_dir, f"{domain}_{digest}.html")
+
+
+async def _extract_one(browser, url, output_dir):
+    started = time.monotonic()
+    result = {"url": url, "success": False, "title": None, "output_path": None, "error": None, "requests": None}
+    context = None
+    try:
+        context = await browser.new_context(extra_http_headers={
+            'Accept-Language': 'en-US,en;q=0.9',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8'
+        })
+        page = await context.new_page()
+        request_filter = await RequestFilter.attach(page)
+        result["requests"] = request_filter.counts
+        
+        # Navigate and wait for content, then a bit more for dynamic content
+        await page.goto(url, wait_until='networkidle', timeout=30000)
+        await page.wait_for_load_state('domcontentloaded')
+        await page.wait_for_timeout(2000)
+        
+        title, main_content = await extract_title_and_content_async(page, url)
+        result["title"] = title
+        if not main_content:
+            raise Exception("No main content found")
+        
+        clean_html = create_clean_html(title, main_content)
+        result["success"] = True
+        if output_dir:
+            result["output_path"] = batch_output_path(output_dir, url)
+            with open(result["output_path"], 'w', encoding='utf-8') as f:
+                f.write(clean_html)
+        else:
+            result["html"] = clean_html
+    except Exception as e:
+        result["error"] = str(e).splitlines()[0] if str(e) else type(e).__name__
+    finally:
+        if context is not None:
+            try:
+                await context.close()
+            except Exception:
+                pass
+    result["elapsed_s"] = round(time.monotonic() - started, 2)
+    return result
+
+
+async def extract_articles_batch(urls, concurrency=BATCH_CONCURRENCY, output_dir=None):
+    """
+    Extract many articles with one Chromium, `concurrency` pages at a time.
+
+    Async generator yielding one result dict per URL as soon as it finishes
+    (url, success, title, output_path or html, error, elapsed_s, and the
+    request filter counts as requests). A failing
+    URL is reported in its result and never stops the batch.
+    """
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    pending = iter(urls)
+    results = asyncio.Queue()
     
-    if result:
-        print("Successfully extracted clean article content")
-    else:
-        print("Failed to extract content")
\ No newline at end of file
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(
+            headless=True,
+            args=['--disable-blink-features=AutomationControlled']
+        )
+        
+        async def worker():
+            # Workers pull URLs lazily, so huge lists never become huge task lists.
+            try:
+                for url in pending:
+                    await results.put(await _extract_one(browser, url, output_dir))
+            finally:
+                await results.put(None)
+        
+        workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+        try:
+            active = len(workers)
+            while active:
+                result = await results.get()
+                if result is None:
+                    active -= 1
+                else:
+                    yield result
+            for task in workers:
+                await task  # surface anything a worker could not report per URL
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await browser.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract clean article HTML from one or more URLs with one shared browser.")
+    parser.add_argument("urls", nargs="*", help="URLs to extract")
+    parser.add_argument("-f", "--file", help="file with one URL per line ('-' for stdin)")
+    parser.add_argument("-o", "--output-dir", default="extracted", help="directory for the extracted HTML files")
+    parser.add_argument("-c", "--concurrency", type=int, default=BATCH_CONCURRENCY, help="pages extracted at once")
+    parser.add_argument("--report", help="write one JSON result per line to this file as URLs finish")
+    args = parser.parse_args()
+    
+    urls = list(args.urls)
+    if args.file:
+        # nullcontext leaves stdin open for the rest of the process
+        source = contextlib.nullcontext(sys.stdin) if args.file == "-" else open(args.file, encoding='utf-8')
+        with source as f:
+            urls.extend(line.strip() for line in f if line.strip() and not line.startswith('#'))
+    if not urls:
+        parser.error("no URLs given")
+    
+    async def run():
+        succeeded = 0
+        report = open(args.report, 'w', encoding='utf-8') if args.report else None
+        try:
+            async for result in extract_articles_batch(urls, args.concurrency, args.output_dir):
+                if result["success"]:
+                    succeeded += 1
+                    print(f"✓ {result['url']} -> {result['output_path']} ({result['elapsed_s']}s)")
+                else:
+                    print(f"✗ {result['url']}: {result['error']}")
+                if report:
+                    report.write(json.dumps(result) + "\n")
+                    report.flush()
+        finally:
+            if report:
+                report.close()
+        print(f"Extracted {succeeded}/{len(urls)} articles")
+        return succeeded
+    
+    succeeded = asyncio.run(run())
+    sys.exit(0 if succeeded == len(urls) else 1)
+
+
+if __name__ == "__main__":
+    main()
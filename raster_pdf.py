@@ -0,0 +1,271 @@
+import io
+import math
+import struct
+import zlib
+
+try:
+    from PIL import Image as PILImage
+except ImportError:
+    # Pillow is optional: only PNGs with real transparency or interlacing need it
+    PILImage = None
+
+
+# Largest page side in default user space units (200in); bigger pages set /UserUnit.
+MAX_PAGE_UNITS = 14400
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_PNG_COLORS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+_JPEG_COLOR_SPACES = {1: "/DeviceGray", 3: "/DeviceRGB", 4: "/DeviceCMYK"}
+# JPEG start-of-frame markers (everything from C0 to CF except DHT, JPG and DAC)
+_JPEG_SOF = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# DeviceN colorants for PNG pixels whose alpha channel is dropped, by
+# component count; a tint transform pops alpha to leave gray or RGB.
+_DROP_ALPHA = {
+    2: ("/Gray /Alpha", "/DeviceGray"),
+    4: ("/Red /Green /Blue /Alpha", "/DeviceRGB"),
+}
+
+
+class RasterImage:
+    """
+    An image ready to embed in a PDF: its image dictionary entries (PDF
+    syntax strings by key), its encoded data as a list of byte chunks and
+    an optional soft mask (another RasterImage) for transparency. With
+    `drop_alpha` set to the component count, the data has an alpha channel
+    last that the PDF is told to ignore.
+    """
+
+    def __init__(self, width, height, entries, data, smask=None, drop_alpha=None):
+        self.width = width
+        self.height = height
+        self.entries = entries
+        self.data = data
+        self.smask = smask
+        self.drop_alpha = drop_alpha
+
+
+def load_image(data, opaque=False):
+    """
+    Wrap PNG or JPEG bytes for embedding, without decoding them where the
+    PDF can take the encoded data as-is: JPEG goes in as DCTDecode and PNG
+    image data as FlateDecode with the PNG predictor. Set `opaque` when the
+    image is known to have no transparent pixels (a page screenshot), so an
+    alpha channel can be ignored instead of decoded into a soft mask.
+    """
+    if data[:8] == PNG_SIGNATURE:
+        return png_image(data, opaque)
+    if data[:2] == b"\xff\xd8":
+        return jpeg_image(data)
+    raise ValueError("Unsupported image format (expected PNG or JPEG)")
+
+
+def _png_chunks(data):
+    pos = len(PNG_SIGNATURE)
+    while pos + 8 <= len(data):
+        length, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        yield kind, pos + 8, pos + 8 + length
+        if kind == b"IEND":
+            return
+        pos += 12 + length
+
+
+def png_image(data, opaque=False):
+    """Embed a PNG by passing its IDAT stream straight through."""
+    header, palette, idat = None, None, []
+    for kind, start, end in _png_chunks(data):
+        if kind == b"IHDR":
+            header = struct.unpack(">IIBBBBB", data[start:end])
+        elif kind == b"PLTE":
+            palette = data[start:end]
+        elif kind == b"IDAT":
+            idat.append(data[start:end])
+    if header is None or not idat:
+        raise ValueError("Truncated PNG: missing IHDR or IDAT")
+    width, height, bit_depth, color_type, _, _, interlace = header
+    has_alpha = color_type in (4, 6)
+    if interlace or (has_alpha and not opaque):
+        if PILImage is None:
+            raise ValueError("Interlaced or transparent PNGs need Pillow (pip install Pillow)")
+        return _decoded_image(data)
+
+    colors = _PNG_COLORS[color_type]
+    entries = {
+        "BitsPerComponent": str(bit_depth),
+        "Filter": "/FlateDecode",
+        "DecodeParms": f"<< /Predictor 15 /Colors {colors} /BitsPerComponent {bit_depth} /Columns {width} >>",
+    }
+    if color_type == 3:
+        entries["ColorSpace"] = f"[/Indexed /DeviceRGB {len(palette) // 3 - 1} <{palette.hex()}>]"
+    elif not has_alpha:
+        entries["ColorSpace"] = "/DeviceRGB" if colors == 3 else "/DeviceGray"
+    return RasterImage(width, height, entries, idat, drop_alpha=colors if has_alpha else None)
+
+
+def jpeg_image(data):
+    """Embed a JPEG unchanged, reading its size and components from the frame header."""
+    pos, adobe = 2, False
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            raise ValueError("Corrupt JPEG: expected a marker")
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+        if marker == 0xEE and data[pos + 4:pos + 9] == b"Adobe":
+            adobe = True
+        if marker in _JPEG_SOF:
+            bits, height, width, components = struct.unpack(">BHHB", data[pos + 4:pos + 10])
+            entries = {
+                "ColorSpace": _JPEG_COLOR_SPACES[components],
+                "BitsPerComponent": str(bits),
+                "Filter": "/DCTDecode",
+            }
+            if components == 4 and adobe:
+                # Adobe writes CMYK JPEGs inverted
+                entries["Decode"] = "[1 0 1 0 1 0 1 0]"
+            return RasterImage(width, height, entries, [data])
+        pos += 2 + length
+    raise ValueError("Corrupt JPEG: no frame header")
+
+
+def _decoded_image(data):
+    """Decode with Pillow, splitting any real transparency into a soft mask."""
+    image = PILImage.open(io.BytesIO(data))
+    image.load()
+    smask = None
+    if "A" in image.getbands() or "transparency" in image.info:
+        alpha = image.convert("RGBA").getchannel("A")
+        if alpha.getextrema() != (255, 255):
+            smask = RasterImage(image.width, image.height, {
+                "ColorSpace": "/DeviceGray",
+                "BitsPerComponent": "8",
+                "Filter": "/FlateDecode",
+            }, [zlib.compress(alpha.tobytes())])
+    gray = image.mode in ("L", "LA", "1", "I", "I;16")
+    image = image.convert("L" if gray else "RGB")
+    entries = {
+        "ColorSpace": "/DeviceGray" if gray else "/DeviceRGB",
+        "BitsPerComponent": "8",
+        "Filter": "/FlateDecode",
+    }
+    return RasterImage(image.width, image.height, entries, [zlib.compress(image.tobytes())], smask)
+
+
+def _number(value):
+    return f"{value:.4f}".rstrip("0").rstrip(".")
+
+
+class RasterPdfWriter:
+    """
+    Writes a PDF made of raster images, incrementally: each image is
+    serialized as soon as it is drawn, and drain() hands over the bytes
+    produced so far, so a caller can stream the document while it is being
+    assembled. Page sizes and image positions are in points, measured from
+    the top-left corner of the page.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+        self._xref = {}
+        # 1 is the catalog and 2 the page tree, both written by close()
+        self._next_id = 3
+        self._pages = []
+        self._page = None
+        self._tint_transforms = {}
+        self._emit(b"%PDF-1.6\n%\xe2\xe3\xcf\xd3\n")
+
+    def _emit(self, data):
+        self._chunks.append(data)
+        self._offset += len(data)
+
+    def _reserve(self):
+        object_id = self._next_id
+        self._next_id += 1
+        return object_id
+
+    def _write_object(self, object_id, body, stream=None):
+        self._xref[object_id] = self._offset
+        self._emit(f"{object_id} 0 obj\n{body}\n".encode("latin-1"))
+        if stream is not None:
+            self._emit(b"stream\n")
+            for chunk in stream:
+                self._emit(chunk)
+            self._emit(b"\nendstream\n")
+        self._emit(b"endobj\n")
+
+    def _tint_transform(self, components):
+        """PostScript function dropping the last of `components` inputs, written once per document."""
+        if components not in self._tint_transforms:
+            function_id = self._tint_transforms[components] = self._reserve()
+            domain = " ".join(["0 1"] * components)
+            range_ = " ".join(["0 1"] * (components - 1))
+            self._write_object(function_id, f"<< /FunctionType 4 /Domain [{domain}] /Range [{range_}] /Length 5 >>",
+                               [b"{pop}"])
+        return self._tint_transforms[components]
+
+    def _write_image(self, image):
+        entries = dict(image.entries)
+        if image.smask is not None:
+            entries["SMask"] = f"{self._write_image(image.smask)} 0 R"
+        if image.drop_alpha:
+            colorants, alternate = _DROP_ALPHA[image.drop_alpha]
+            entries["ColorSpace"] = f"[/DeviceN [{colorants}] {alternate} {self._tint_transform(image.drop_alpha)} 0 R]"
+        length = sum(len(chunk) for chunk in image.data)
+        body = " ".join(f"/{key} {value}" for key, value in entries.items())
+        image_id = self._reserve()
+        self._write_object(image_id, f"<< /Type /XObject /Subtype /Image /Width {image.width} "
+                                     f"/Height {image.height} {body} /Length {length} >>", image.data)
+        return image_id
+
+    def begin_page(self, width, height):
+        """Start a page of `width` x `height` points."""
+        if self._page is not None:
+            raise RuntimeError("end_page() the current page first")
+        unit = max(1, math.ceil(max(width, height) / MAX_PAGE_UNITS))
+        self._page = {"width": width, "height": height, "unit": unit, "images": [], "content": []}
+
+    def draw_image(self, image, x, y, width, height):
+        """Embed `image` now and place it at (x, y) on the current page, scaled to width x height."""
+        page = self._page
+        image_id = self._write_image(image)
+        name = f"Im{len(page['images']) + 1}"
+        page["images"].append((name, image_id))
+        unit = page["unit"]
+        bottom = page["height"] - y - height
+        page["content"].append(f"q {_number(width / unit)} 0 0 {_number(height / unit)} "
+                               f"{_number(x / unit)} {_number(bottom / unit)} cm /{name} Do Q")
+
+    def end_page(self):
+        page, self._page = self._page, None
+        content = "\n".join(page["content"]).encode("latin-1")
+        content_id = self._reserve()
+        self._write_object(content_id, f"<< /Length {len(content)} >>", [content])
+        unit = page["unit"]
+        images = " ".join(f"/{name} {image_id} 0 R" for name, image_id in page["images"])
+        user_unit = f" /UserUnit {unit}" if unit > 1 else ""
+        page_id = self._reserve()
+        self._write_object(page_id, f"<< /Type /Page /Parent 2 0 R "
+                                    f"/MediaBox [0 0 {_number(page['width'] / unit)} {_number(page['height'] / unit)}]"
+                                    f"{user_unit} /Resources << /XObject << {images} >> >> "
+                                    f"/Contents {content_id} 0 R >>")
+        self._pages.append(page_id)
+
+    def close(self):
+        """Write the page tree, catalog, cross-reference table and trailer."""
+        if self._page is not None:
+            self.end_page()
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._pages)
+        self._write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._pages)} >>")
+        self._write_object(1, "<< /Type /Catalog /Pages 2 0 R >>")
+        xref_offset = self._offset
+        lines = [f"xref\n0 {self._next_id}\n", "0000000000 65535 f \n"]
+        lines.extend(f"{self._xref[object_id]:010d} 00000 n \n" for object_id in range(1, self._next_id))
+        lines.append(f"trailer\n<< /Size {self._next_id} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n")
+        self._emit("".join(lines).encode("latin-1"))
+
+    def drain(self):
+        """Return the bytes written since the last drain, as a list of chunks."""
+        chunks, self._chunks = self._chunks, []
+        return chunks
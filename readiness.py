@@ -0,0 +1,177 @@
+import asyncio
+import os
+import time
+
+import metrics
+
+
+# --- READINESS CONFIGURATION ---
+# Total time all the waits on one page may take, and how long the DOM and
+# network must stay quiet. The budget defaults to the shortest run of fixed
+# sleeps the waits replaced (the screenshot renderer's 5 s).
+READY_BUDGET_MS = int(os.environ.get("PDF_READY_BUDGET_MS", "5000"))
+READY_QUIET_MS = int(os.environ.get("PDF_READY_QUIET_MS", "300"))
+POLL_INTERVAL_MS = 50
+
+# Signals in the order they are reported.
+SIGNALS = ("fonts", "images", "dom-quiet", "network-idle")
+
+# Installed before any page script runs, so DOM mutations are tracked from the start.
+_INSTALL_OBSERVER_FN = """
+() => {
+    if (window.__pdfReadiness) return;
+    const state = {lastMutation: performance.now(), lastImage: 0, fontsLoaded: 0, fontsReady: null,
+                   decoding: new WeakSet(), decoded: new WeakSet()};
+    window.__pdfReadiness = state;
+    new MutationObserver(() => { state.lastMutation = performance.now(); })
+        .observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+    document.addEventListener('error', (event) => {
+        if (event.target.tagName === 'IMG') state.lastImage = performance.now();
+    }, true);
+}
+"""
+
+_INSTALL_OBSERVER_JS = f"({_INSTALL_OBSERVER_FN})();"
+
+_PROBE_JS = """
+() => {
+    (INSTALL)();
+    const state = window.__pdfReadiness;
+
+    const fonts = document.fonts ? document.fonts.status === 'loaded' : true;
+    if (!fonts && state.fontsReady !== document.fonts.ready) {
+        state.fontsReady = document.fonts.ready;
+        state.fontsReady.then(() => { state.fontsLoaded = performance.now(); });
+    }
+
+    let pendingImages = 0;
+    for (const img of document.images) {
+        if (state.decoded.has(img)) continue;
+        if (!img.complete) {
+            // Off-screen lazy images are never requested; don't wait for them.
+            if (img.loading !== 'lazy') pendingImages++;
+            continue;
+        }
+        if (img.naturalWidth === 0) { state.decoded.add(img); continue; }  // broken image
+        pendingImages++;
+        if (!state.decoding.has(img)) {
+            state.decoding.add(img);
+            img.decode().catch(() => {}).then(() => {
+                state.decoded.add(img);
+                state.lastImage = performance.now();
+            });
+        }
+    }
+
+    const now = performance.now();
+    return {
+        fonts: fonts,
+        pendingImages: pendingImages,
+        sinceFonts: now - state.fontsLoaded,
+        sinceImage: now - state.lastImage,
+        sinceMutation: now - state.lastMutation
+    };
+}
+""".replace("INSTALL", _INSTALL_OBSERVER_FN.strip())
+
+
+class PageReadiness:
+    """
+    Event-driven replacement for fixed `wait_for_timeout` sleeps.
+
+    Attach it to a page before navigating so in-flight requests are counted,
+    then call `wait()` whenever the page must be stable. A wait returns as soon
+    as fonts are loaded, every image is decoded, the DOM has not mutated and no
+    request has been in flight for the quiet window, or when the page's
+    readiness budget, shared by all of its waits, runs out.
+    """
+
+    def __init__(self, page, budget_ms=READY_BUDGET_MS):
+        self.page = page
+        self.history = []
+        self._budget_left = budget_ms / 1000
+        self._inflight = set()
+        self._last_network_activity = time.monotonic()
+
+    @classmethod
+    async def attach(cls, page, budget_ms=READY_BUDGET_MS):
+        readiness = cls(page, budget_ms)
+        page.on("request", readiness._on_request_started)
+        page.on("requestfinished", readiness._on_request_done)
+        page.on("requestfailed", readiness._on_request_done)
+        await page.add_init_script(_INSTALL_OBSERVER_JS)
+        return readiness
+
+    def _on_request_started(self, request):
+        self._inflight.add(request)
+        self._last_network_activity = time.monotonic()
+
+    def _on_request_done(self, request):
+        self._inflight.discard(request)
+        self._last_network_activity = time.monotonic()
+
+    async def wait(self, step="wait", quiet_ms=READY_QUIET_MS):
+        """
+        Wait until the page is stable and return a summary of the wait.
+
+        `ended_by` names the signal that settled last, "stable" when the page
+        was already stable, or "timeout" when the budget ran out.
+        """
+        started = time.monotonic()
+        deadline = started + max(0.0, self._budget_left)
+        waited_on = set()
+
+        while True:
+            pending, settled_at = await self._pending_signals(quiet_ms)
+            if not pending:
+                if waited_on:
+                    ended_by = max(waited_on, key=lambda signal: settled_at[signal])
+                else:
+                    ended_by = "stable"
+                break
+            if time.monotonic() >= deadline:
+                ended_by = "timeout"
+                break
+            waited_on.update(pending)
+            await asyncio.sleep(POLL_INTERVAL_MS / 1000)
+
+        elapsed = time.monotonic() - started
+        self._budget_left -= elapsed
+        metrics.record("readiness", elapsed)
+        result = {
+            "step": step,
+            "ended_by": ended_by,
+            "elapsed_ms": int(elapsed * 1000),
+            "pending": pending,
+        }
+        self.history.append(result)
+        print(f"Page ready ({step}) after {result['elapsed_ms']}ms, ended by: {ended_by}"
+              + (f" (still pending: {', '.join(pending)})" if pending else ""))
+        return result
+
+    async def _pending_signals(self, quiet_ms):
+        """Return the signals still pending and when each one last settled (monotonic seconds)"""
+        now = time.monotonic()
+        try:
+            probe = await self.page.evaluate(_PROBE_JS)
+        except Exception:
+            # The page is mid-navigation; treat everything as pending and retry.
+            return list(SIGNALS), {}
+
+        settled_at = {
+            "fonts": now - probe["sinceFonts"] / 1000,
+            "images": now - probe["sinceImage"] / 1000,
+            "dom-quiet": now - (probe["sinceMutation"] - quiet_ms) / 1000,
+            "network-idle": self._last_network_activity + quiet_ms / 1000,
+        }
+        pending = []
+        if not probe["fonts"]:
+            pending.append("fonts")
+        if probe["pendingImages"]:
+            pending.append("images")
+        if probe["sinceMutation"] < quiet_ms:
+            pending.append("dom-quiet")
+        network_quiet = (now - self._last_network_activity) * 1000 >= quiet_ms
+        if self._inflight or not network_quiet:
+            pending.append("network-idle")
+        return pending, settled_at
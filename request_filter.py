@@ -0,0 +1,146 @@
+import os
+import threading
+from urllib.parse import urlparse
+
+import metrics
+
+
+# --- REQUEST FILTER CONFIGURATION ---
+# Hosts whose requests are always aborted (subdomains included).
+BLOCKLIST_FILE = os.environ.get("REQUEST_BLOCKLIST_FILE",
+                                os.path.join(os.path.dirname(os.path.abspath(__file__)), "blocklist.txt"))
+# Playwright resource types never fetched while rendering or extracting.
+BLOCKED_RESOURCE_TYPES = frozenset(filter(None, os.environ.get(
+    "REQUEST_BLOCKED_TYPES", "media,websocket,eventsource,manifest,texttrack,ping").split(",")))
+# Resource types only fetched from the page's own site when that site is known.
+FIRST_PARTY_TYPES = frozenset(filter(None, os.environ.get("REQUEST_FIRST_PARTY_TYPES", "image").split(",")))
+
+# Second-level labels under which sites register one level deeper (example.co.uk).
+_SECOND_LEVEL = {"co", "com", "net", "org", "gov", "ac", "edu", "ne", "or", "go"}
+
+_totals = {}
+_totals_lock = threading.Lock()
+
+
+@metrics.registry.gauge("pdf_requests_blocked_total", "Page requests aborted by the request filter.",
+                        labelname="reason", kind="counter")
+def _blocked_totals():
+    with _totals_lock:
+        return dict(_totals)
+
+
+def load_blocklist(path):
+    """
+    Read a host blocklist: bare host names, hosts-file entries ("0.0.0.0 host")
+    or domain-only Adblock rules ("||host^"). Other lines are skipped.
+    """
+    hosts = set()
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.split("#", 1)[0].strip()
+                if not line or line.startswith("!"):
+                    continue
+                if line.startswith("||"):
+                    if not line.endswith("^"):
+                        continue
+                    line = line[2:-1]
+                fields = line.split()
+                host = fields[-1].lower()
+                if "/" not in host and "$" not in host and host not in ("localhost", "0.0.0.0"):
+                    hosts.add(host)
+    except OSError as e:
+        print(f"Could not load request blocklist {path}: {str(e)}")
+    return frozenset(hosts)
+
+
+BLOCKED_HOSTS = load_blocklist(BLOCKLIST_FILE)
+
+
+def site_of(host):
+    """The registrable part of a host name: news.example.com -> example.com, a.b.co.uk -> b.co.uk."""
+    labels = (host or "").lower().rstrip(".").split(".")
+    keep = 3 if len(labels) > 2 and len(labels[-1]) == 2 and labels[-2] in _SECOND_LEVEL else 2
+    return ".".join(labels[-keep:])
+
+
+class RequestFilter:
+    """
+    Route handler that aborts a page's requests to blocklisted hosts and of
+    blocked resource types. With `first_party` set, first-party-only types
+    from sites other than the page's own are aborted too; the page's site is
+    taken from the URL its main frame ends up on after redirects, and the
+    rule is off while that is not an http(s) URL. The main document is never
+    blocked. Images that `local_assets(url)` has on disk, as (path, content
+    type), are answered from there without touching the network. `counts`
+    tallies allowed, locally served and blocked requests by reason.
+    """
+
+    def __init__(self, local_assets=None, first_party=True, blocked_hosts=BLOCKED_HOSTS,
+                 blocked_types=BLOCKED_RESOURCE_TYPES, first_party_types=FIRST_PARTY_TYPES):
+        self.own_sites = set()
+        self.local_assets = local_assets
+        self.first_party = first_party
+        self.blocked_hosts = blocked_hosts
+        self.blocked_types = blocked_types
+        self.first_party_types = first_party_types
+        self.counts = {"allowed": 0, "local": 0, "blocked": 0, "blocked_by": {}}
+
+    @classmethod
+    async def attach(cls, page, local_assets=None, first_party=True):
+        request_filter = cls(local_assets, first_party)
+        page.on("framenavigated", request_filter._navigated)
+        await page.route("**/*", request_filter._handle)
+        return request_filter
+
+    def _navigated(self, frame):
+        """Track the site of the main frame's committed URL, so redirects to another domain are followed."""
+        if frame.parent_frame is None:
+            parsed = urlparse(frame.url)
+            self.own_sites = {site_of(parsed.hostname)} if parsed.scheme in ("http", "https") else set()
+
+    def _is_blocked_host(self, host):
+        labels = host.split(".")
+        return any(".".join(labels[i:]) in self.blocked_hosts for i in range(len(labels) - 1))
+
+    def reason(self, url, resource_type, main_document=False):
+        """Why a request should be aborted, or None to let it through."""
+        parsed = urlparse(url)
+        if main_document or parsed.scheme not in ("http", "https"):
+            return None
+        host = (parsed.hostname or "").lower()
+        if self._is_blocked_host(host):
+            return "blocklist"
+        if resource_type in self.blocked_types:
+            return "resource-type"
+        if (self.first_party and self.own_sites and resource_type in self.first_party_types
+                and site_of(host) not in self.own_sites):
+            return "third-party"
+        return None
+
+    def _check(self, request):
+        """Return ("block", reason), ("local", (path, content type)) or ("allow", None)."""
+        main_document = request.is_navigation_request() and request.frame.parent_frame is None
+        reason = self.reason(request.url, request.resource_type, main_document)
+        if reason is not None:
+            self.counts["blocked"] += 1
+            self.counts["blocked_by"][reason] = self.counts["blocked_by"].get(reason, 0) + 1
+            with _totals_lock:
+                _totals[reason] = _totals.get(reason, 0) + 1
+            return "block", reason
+        if self.local_assets is not None and request.resource_type == "image":
+            local = self.local_assets(request.url)
+            if local:
+                self.counts["local"] += 1
+                return "local", local
+        self.counts["allowed"] += 1
+        return "allow", None
+
+    async def _handle(self, route):
+        action, detail = self._check(route.request)
+        if action == "block":
+            await route.abort("blockedbyclient")
+        elif action == "local":
+            await route.fulfill(path=detail[0], content_type=detail[1])
+        else:
+            await route.continue_()
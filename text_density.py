@@ -0,0 +1,77 @@
+from bs4 import NavigableString, Tag
+
+
+CONTENT_TAGS = frozenset(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li'])
+
+
+class NodeStats:
+    """
+    Text statistics for one element, matching what the extractors used to
+    recompute with get_text(strip=True) and find_all() on every candidate.
+    Descendant counts exclude the element itself, as find_all() does.
+    """
+
+    __slots__ = ('text_len', 'comma_count', 'link_text_len', 'p_count', 'p_text_len', 'content_count')
+
+    def __init__(self):
+        self.text_len = 0        # len(element.get_text(strip=True))
+        self.comma_count = 0     # element.get_text(strip=True).count(',')
+        self.link_text_len = 0   # text length of every <a> below the element
+        self.p_count = 0         # len(element.find_all('p'))
+        self.p_text_len = 0      # text length of every <p> below the element
+        self.content_count = 0   # paragraphs, headings and list items below the element
+
+
+class DensityIndex:
+    """
+    Per-element text, link, paragraph and comma counts for a whole tree,
+    computed in one post-order pass so candidate scoring becomes a lookup
+    instead of a fresh subtree walk for every candidate.
+
+    The index describes the tree as it was when built; rebuild it after
+    removing elements if the counts must reflect the change.
+    """
+
+    def __init__(self, root):
+        self._stats = {}
+        self._build(root)
+
+    def __getitem__(self, tag):
+        return self._stats[id(tag)]
+
+    def get(self, tag):
+        return self._stats.get(id(tag))
+
+    def _build(self, root):
+        # Iterative post-order walk; deeply nested pages would overflow recursion.
+        stack = [(root, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if not children_done:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(node.contents) if isinstance(child, Tag))
+                continue
+
+            stats = NodeStats()
+            for child in node.contents:
+                if isinstance(child, Tag):
+                    child_stats = self._stats[id(child)]
+                    stats.text_len += child_stats.text_len
+                    stats.comma_count += child_stats.comma_count
+                    stats.link_text_len += child_stats.link_text_len
+                    stats.p_count += child_stats.p_count
+                    stats.p_text_len += child_stats.p_text_len
+                    stats.content_count += child_stats.content_count
+                    if child.name == 'a':
+                        stats.link_text_len += child_stats.text_len
+                    elif child.name == 'p':
+                        stats.p_count += 1
+                        stats.p_text_len += child_stats.text_len
+                    if child.name in CONTENT_TAGS:
+                        stats.content_count += 1
+                elif type(child) is NavigableString:
+                    # get_text() on an ancestor skips comments, doctypes and script/style text.
+                    text = child.strip()
+                    stats.text_len += len(text)
+                    stats.comma_count += text.count(',')
+            self._stats[id(node)] = stats